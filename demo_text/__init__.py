@@ -5,21 +5,23 @@ import sys
 from flask import Flask
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from redis import StrictRedis
 
 from log import LoggerManager, setup_log
 from settings import Config
 from .exceptions import handle_exception
 from .middlewares import MiddlewareManger
-from .utils.db import DBManager
+from .utils.db import DBManager, engine_options
+from .utils.querystats import query_instrumentation
+from .utils.redis_client import create_redis_store
 from .utils.response import Response
 
 db = SQLAlchemy()
+db_manager = DBManager()
 middle_manger = MiddlewareManger()
 log_manager = LoggerManager()
 setup_log()
 
-redis_store = StrictRedis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB, decode_responses=True)
+redis_store = create_redis_store(Config)
 
 def create_app():
     if getattr(sys, 'frozen', False):
@@ -31,14 +33,19 @@ def create_app():
         app = Flask(__name__, static_url_path='')
 
     app.config.from_object(Config)
+    # Flask-SQLAlchemy 与 DBManager 使用同一份连接池配置
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options())
     # Session(app)
     # 跨域
     CORS(app, supports_credentials=True)
     # CORS(app)
 
     db.init_app(app)
+    db_manager.init_app(app, db)
+    query_instrumentation.init_app(app)
 
     middle_manger.init_app(app)
+    middle_manger.add_metrics_provider(db_manager.pool_metrics)
 
     @app.errorhandler(Exception)
     def handle_exceptions(error):
@@ -49,12 +56,18 @@ def create_app():
         return Response.success(Config.APP_NAME)
 
     from demo_text.controllers import (
-        taskmode_blue
+        taskmode_blue,
+        map_blue,
+        state_blue,
+        history_blue
     )
     API_PREFIX = '/api'
     app.register_blueprint(taskmode_blue, url_prefix=API_PREFIX)
+    app.register_blueprint(map_blue, url_prefix=API_PREFIX)
+    app.register_blueprint(state_blue, url_prefix=API_PREFIX)
+    app.register_blueprint(history_blue, url_prefix=API_PREFIX)
 
     return app
 
 
-__all__ = ['db', 'redis_store', 'create_app']
\ No newline at end of file
+__all__ = ['db', 'db_manager', 'redis_store', 'create_app']
\ No newline at end of file
@@ -4,5 +4,8 @@ from flask import Blueprint
 
 path = os.getcwd()
 taskmode_blue = Blueprint('taskmode_blue', __name__)
+map_blue = Blueprint('map_blue', __name__)
+state_blue = Blueprint('state_blue', __name__)
+history_blue = Blueprint('history_blue', __name__)
 
-from .adcl import taskmode
\ No newline at end of file
+from .adcl import taskmode, maps, state, history
\ No newline at end of file
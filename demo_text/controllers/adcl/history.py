@@ -0,0 +1,133 @@
+import datetime
+
+from flask import request
+
+from demo_text.controllers import history_blue
+from demo_text.exceptions import APIException
+from demo_text.models.models import Taskdetail, CarEveryday, ConnectDevice
+from demo_text.models.projections import TaskdetailRow, iterate
+from demo_text.utils.db import yield_per
+from demo_text.utils.pagination import keyset_paginate
+from demo_text.utils.rollup import day_timestamp
+from demo_text.utils.response import Response, StatusCode
+
+MAX_PAGE_SIZE = 200
+
+
+def parse_date(name):
+    '''解析请求参数中的日期 YYYY-MM-DD，未传时为 None'''
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise APIException(msg=StatusCode.PARAMERR[1], error_code=StatusCode.PARAMERR[0], status_code=200)
+
+
+def date_range():
+    '''
+    请求参数中的日期范围 [begin, end + 1天)
+    '''
+    begin = parse_date('begin')
+    end = parse_date('end')
+    if end is not None:
+        end += datetime.timedelta(days=1)
+    return begin, end
+
+
+def page_args():
+    '''游标分页参数 sort、order、cursor、limit（最大 MAX_PAGE_SIZE）'''
+    limit = request.args.get('limit', 20, type=int)
+    return {
+        'sort': request.args.get('sort'),
+        'order': request.args.get('order', 'desc'),
+        'cursor': request.args.get('cursor'),
+        'limit': min(max(limit, 1), MAX_PAGE_SIZE),
+    }
+
+
+@history_blue.route('/history/taskdetail/', methods=['GET'])
+def taskdetail_export():
+    '''
+    导出任务执行记录，按 id 顺序流式返回
+    可选参数 carid、taskid、begin、end（YYYY-MM-DD，按开始任务时间过滤）
+    '''
+    begin, end = date_range()
+
+    criteria = []
+    carid = request.args.get('carid', type=int)
+    if carid is not None:
+        criteria.append(Taskdetail.carid == carid)
+    taskid = request.args.get('taskid', type=int)
+    if taskid is not None:
+        criteria.append(Taskdetail.taskid == taskid)
+    if begin is not None:
+        criteria.append(Taskdetail.begintime >= begin)
+    if end is not None:
+        criteria.append(Taskdetail.begintime < end)
+
+    # 只读导出直接读取列，不构造 ORM 实例
+    rows = iterate(TaskdetailRow, *criteria, order_by=Taskdetail.id)
+    return Response.stream(row.to_dict() for row in rows)
+
+
+@history_blue.route('/history/careveryday/', methods=['GET'])
+def careveryday_export():
+    '''
+    导出车辆每日工作信息，按 id 顺序流式返回
+    可选参数 car_id、begin、end（YYYY-MM-DD）
+    '''
+    begin, end = date_range()
+
+    query = CarEveryday.query
+    car_id = request.args.get('car_id', type=int)
+    if car_id is not None:
+        query = query.filter(CarEveryday.car_id == car_id)
+    if begin is not None:
+        query = query.filter(CarEveryday.datatime >= day_timestamp(begin))
+    if end is not None:
+        query = query.filter(CarEveryday.datatime < day_timestamp(end))
+
+    rows = yield_per(query.order_by(CarEveryday.id))
+    return Response.stream(row.to_dict() for row in rows)
+
+
+@history_blue.route('/history/taskdetail/page/', methods=['GET'])
+def taskdetail_page():
+    '''
+    任务执行记录游标分页
+    可选参数 carid、sort（createat、begintime）、order（asc、desc）、cursor、limit
+    返回 {items, next_cursor, has_more}，取下一页时传入 cursor=next_cursor
+    '''
+    query = Taskdetail.query
+    carid = request.args.get('carid', type=int)
+    if carid is not None:
+        query = query.filter(Taskdetail.carid == carid)
+    return Response.success(keyset_paginate(Taskdetail, query, **page_args()).to_dict())
+
+
+@history_blue.route('/history/careveryday/page/', methods=['GET'])
+def careveryday_page():
+    '''
+    车辆每日工作信息游标分页
+    可选参数 car_id、sort（datatime）、order（asc、desc）、cursor、limit
+    '''
+    query = CarEveryday.query
+    car_id = request.args.get('car_id', type=int)
+    if car_id is not None:
+        query = query.filter(CarEveryday.car_id == car_id)
+    return Response.success(keyset_paginate(CarEveryday, query, **page_args()).to_dict())
+
+
+@history_blue.route('/history/conninfo/page/', methods=['GET'])
+def conninfo_page():
+    '''
+    远程连接记录游标分页
+    可选参数 car_id、sort（create_at、begin_time）、order（asc、desc）、cursor、limit
+    '''
+    query = ConnectDevice.query
+    car_id = request.args.get('car_id', type=int)
+    if car_id is not None:
+        query = query.filter(ConnectDevice.car_id == car_id)
+    return Response.success(keyset_paginate(ConnectDevice, query, **page_args()).to_dict())
@@ -0,0 +1,25 @@
+
+from flask import request
+
+from demo_text.controllers import map_blue
+from demo_text.models.models import Map
+from demo_text.utils.geometry import encode_points, PACKED_MIMETYPE
+from demo_text.utils.response import Response, StatusCode
+
+
+@map_blue.route('/map/<int:mapid>/latlgs/', methods=['GET'])
+def map_latlgs(mapid):
+    '''
+    获取高精度地图坐标点集
+    format=packed 或 Accept 为 application/x-latlgs-packed 时返回二进制坐标数据，
+    格式见 demo_text.utils.geometry.encode_points
+    '''
+    points = Map.get_points(mapid)
+    if points is None:
+        return Response.error(StatusCode.NODATA)
+
+    if request.args.get('format') == 'packed' or \
+            request.accept_mimetypes.best == PACKED_MIMETYPE:
+        return Response.binary(encode_points(points), mimetype=PACKED_MIMETYPE)
+
+    return Response.success({'id': mapid, 'latlgs': points.tolist()})
@@ -0,0 +1,17 @@
+
+from flask import request
+
+from demo_text.controllers import state_blue
+from demo_text.utils.response import Response
+from demo_text.utils.state import state_publisher
+
+
+@state_blue.route('/state/snapshot/', methods=['GET'])
+def state_snapshot():
+    '''
+    车辆、台架状态快照，客户端断线重连或发现版本缺失后用于重新同步
+    可选参数 car_id、operation_id 按车辆或作业区域过滤
+    '''
+    car_id = request.args.get('car_id', type=int)
+    operation_id = request.args.get('operation_id', type=int)
+    return Response.success(state_publisher.snapshot(car_id=car_id, operation_id=operation_id))
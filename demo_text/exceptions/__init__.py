@@ -1,7 +1,6 @@
 import sys
-import traceback
 
-from flask import jsonify, request, current_app
+from flask import request, current_app, g
 from werkzeug.exceptions import NotFound
 
 from demo_text.utils.response import Response
@@ -43,17 +42,21 @@ def handle_exception(error):
         resp.status_code = 404
 
     elif isinstance(error, APIException):
-        resp = jsonify(error.to_dict())
+        resp = Response.json(error.to_dict())
         resp.status_code = error.status_code
 
     else:
+        g.request_error = True
         ex_type, ex_val, ex_stack = sys.exc_info()
         filename = ''
         lineno = ''
-        for idx, stack in enumerate(traceback.extract_tb(ex_stack)):
-            if idx == len(traceback.extract_tb(ex_stack)) - 1:
-                filename = stack.filename
-                lineno = stack.lineno
+        # 只取最后一帧
+        tb = ex_stack
+        while tb is not None and tb.tb_next is not None:
+            tb = tb.tb_next
+        if tb is not None:
+            filename = tb.tb_frame.f_code.co_filename
+            lineno = tb.tb_lineno
         params = {
             'type': 'handle_exceptions',
             'filename': filename,
@@ -1,20 +1,97 @@
-import re
+import sys
+import time
+import timeit
 
-from flask import request, current_app
+from flask import request, current_app, g
 
 from demo_text.exceptions import APIException
+from demo_text.utils.metrics import request_metrics
+from demo_text.utils.request_id import get_request_id
+
+METRICS_PATH = '/api/_metrics'
+# 无需登录即可访问的接口
+DEFAULT_PUBLIC_PATHS = ('/api/user/login/', '/api/login/app/', METRICS_PATH)
+
+
+def verify_token(token):
+    '''
+    默认的 token 校验函数，返回用户对象或 None
+    先按后台用户校验，失败时按 app/服务用户（SECRET_KEY + 'for_service' 签名）校验，
+    只允许后台用户访问的接口由 is_login() 再做限制
+    '''
+    from demo_text.models.models import User, ServiceUserInfo
+    user = User.verify_user_token(token)
+    if user is None:
+        user = ServiceUserInfo.verify_user_token(token, is_service_user=True)
+    return user
+
+
+class CountingIterable(object):
+    '''
+    包装流式响应体，统计实际发送的字节数，迭代结束或关闭时调用一次 callback(size)
+    '''
+
+    def __init__(self, iterable, callback, charset='utf-8'):
+        self.iterable = iterable
+        self.callback = callback
+        self.charset = charset
+        self.size = 0
+        self._done = False
+
+    def __iter__(self):
+        for chunk in self.iterable:
+            self.size += len(chunk.encode(self.charset) if isinstance(chunk, str) else chunk)
+            yield chunk
+        self._finish()
+
+    def close(self):
+        try:
+            close = getattr(self.iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._finish()
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self.callback(self.size)
+
 
 class MiddlewareManger(object):
     '''
     中间件管理类
     '''
 
-    def __init__(self, app=None):
+    def __init__(self, app=None, verifier=None):
         self.app = app
+        self.verifier = verifier
+        self.api_prefix = '/api/'
+        self.auth_methods = frozenset(['GET', 'POST', 'PUT', 'DELETE'])
+        self.public_paths = frozenset(DEFAULT_PUBLIC_PATHS)
+        self.public_prefixes = ()
+        self.public_endpoints = frozenset()
+        self.metrics_providers = []
         if app is not None:
             self.init_app(app)
 
-    def init_app(self, app):
+    def init_app(self, app, verifier=None):
+        '''
+        :param app: flask app
+        :param verifier: token 校验函数，接收 token，返回用户对象或 None，默认 verify_token
+        '''
+        if verifier is not None:
+            self.verifier = verifier
+        if self.verifier is None:
+            self.verifier = verify_token
+
+        # 路由分类只在初始化时计算一次；自定义 AUTH_PUBLIC_PATHS 时指标接口同样无需登录，供监控抓取
+        self.public_paths = frozenset(app.config.get('AUTH_PUBLIC_PATHS', DEFAULT_PUBLIC_PATHS)) | {METRICS_PATH}
+        self.public_prefixes = tuple(app.config.get('AUTH_PUBLIC_PREFIXES', ()))
+        self.public_endpoints = frozenset(app.config.get('AUTH_PUBLIC_ENDPOINTS', ()))
+
+        app.add_url_rule(METRICS_PATH, 'metrics', self.metrics)
+
         @app.before_request
         def pre_process():
             return self.before_request()
@@ -23,33 +100,106 @@ class MiddlewareManger(object):
         def post_process(response):
             return self.after_request(response)
 
+    def add_metrics_provider(self, provider):
+        '''添加 /api/_metrics 的额外指标，provider 返回 Prometheus 文本'''
+        self.metrics_providers.append(provider)
+
+    def add_public_path(self, path):
+        self.public_paths = self.public_paths | {path}
+
+    def is_public(self, path, endpoint):
+        if not path.startswith(self.api_prefix):
+            return True
+        if path in self.public_paths or endpoint in self.public_endpoints:
+            return True
+        return bool(self.public_prefixes) and path.startswith(self.public_prefixes)
+
     def before_request(self):
         '''
         This call before the request to be processing
         '''
-        # TODO 进行认证校验
-        if request.method in ['GET', 'POST', 'PUT', 'DELETE']:
-            pattern = re.compile('/api/')
-            res = re.findall(pattern, request.path)
-            # 验证激活
-            if res and request.path not in ['/api/user/login/', '/api/login/app/']:
-
-                try:
-                    token = request.headers.get('speepertoken')
-                    # if not token:
-                    #     raise APIException(msg='没有登录', error_code=100008, status_code=200)
-                    # user = User.verify_user_token(token)
-                    # if not user:
-                    #     raise APIException(msg='没有登录', error_code=100008, status_code=200)
-
-                except Exception as e:
-                    current_app.logger.error(e)
-                    raise APIException(msg='没有登录', error_code=100008, status_code=200)
+        g.request_start = time.perf_counter()
+        g.request_id = request.headers.get('X-Request-Id') or get_request_id()
+
+        if request.method not in self.auth_methods or self.is_public(request.path, request.endpoint):
+            return None
+
+        # 验证登录
+        try:
+            token = request.headers.get('speepertoken')
+            user = self.verifier(token) if token else None
+        except Exception as e:
+            current_app.logger.error(e)
+            user = None
+
+        if not user:
+            raise APIException(msg='没有登录', error_code=100008, status_code=200)
+        g.user = user
         return None
 
     def after_request(self, response):
         '''
         This call after the request to be processed
         '''
-        # TODO 记录请求日志
+        start = g.get('request_start')
+        if start is not None:
+            endpoint = request.endpoint or 'unknown'
+            error = response.status_code >= 500 or g.get('request_error', False)
+            if response.is_streamed and response.content_length is None:
+                # 流式响应不能在这里计算长度（会把整个响应体读入内存），发送完成或关闭时再记录
+                def observe(size):
+                    request_metrics.observe(endpoint, time.perf_counter() - start, size=size, error=error)
+                response.response = CountingIterable(response.response, observe, response.charset)
+            else:
+                request_metrics.observe(endpoint, time.perf_counter() - start,
+                                        size=response.calculate_content_length() or 0, error=error)
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-Id'] = request_id
         return response
+
+    def metrics(self):
+        '''接口统计，Prometheus 文本格式'''
+        body = request_metrics.to_prometheus() + ''.join(provider() for provider in self.metrics_providers)
+        return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+
+def benchmark(number=20000, out=sys.stdout):
+    '''
+    中间件 before/after 钩子的单次耗时，以及有无中间件时完整请求（test_client）的耗时
+    usage:
+        python -m demo_text.middlewares [number]
+
+    :param number: 执行次数
+    '''
+    from flask import Flask
+
+    user = object()
+
+    def make_app(with_middleware):
+        app = Flask(__name__)
+        app.add_url_rule('/api/ping/', 'ping', lambda: 'ok')
+        app.add_url_rule('/api/user/login/', 'login', lambda: 'ok')
+        if with_middleware:
+            MiddlewareManger().init_app(app, verifier=lambda token: user)
+        return app
+
+    app = make_app(True)
+    manager = MiddlewareManger()
+    manager.init_app(Flask(__name__), verifier=lambda token: user)
+    response = app.response_class('ok')
+    for name, path, headers in (('hooks public', '/api/user/login/', {}),
+                                ('hooks auth', '/api/ping/', {'speepertoken': 'token'})):
+        with app.test_request_context(path, headers=headers):
+            def hooks():
+                manager.before_request()
+                manager.after_request(response)
+            seconds = min(timeit.repeat(hooks, number=number, repeat=3)) / number
+        out.write('{:<28} {:>8.2f} us/request\n'.format(name, seconds * 1e6))
+
+    client_number = max(number // 10, 1)
+    for name, with_middleware in (('request without', False), ('request with', True)):
+        client = make_app(with_middleware).test_client()
+        seconds = min(timeit.repeat(lambda: client.get('/api/ping/', headers={'speepertoken': 'token'}),
+                                    number=client_number, repeat=3)) / client_number
+        out.write('{:<28} {:>8.2f} us/request\n'.format(name + ' middleware', seconds * 1e6))
@@ -0,0 +1,5 @@
+import sys
+
+from demo_text.middlewares import benchmark
+
+benchmark(number=int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -1,14 +1,113 @@
 
 import datetime
+import hashlib
 
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer, SignatureExpired, BadSignature
-from sqlalchemy import Column, String, TIMESTAMP, Text, text, UnicodeText
+from sqlalchemy import Column, Index, String, TIMESTAMP, Text, text, UnicodeText, event, inspect
 from sqlalchemy.dialects.mysql import INTEGER, TINYINT, MEDIUMTEXT
+from sqlalchemy.orm import make_transient_to_detached, object_session
 
-from demo_text import db
+from demo_text import db, redis_store
+from demo_text.utils.cache import TTLCache
+from demo_text.utils.geometry import geometry_cache, iter_latlgs, polygon_stats
 from settings import Config
 
 
+# 已验证的 token -> (用户字段快照, 失效版本号)，过期时间不超过 token 本身的过期时间。
+# 多 worker 部署时，用户变化通过 redis 中的版本号通知其他 worker：命中缓存时比对版本号，不一致即视为未命中。
+# redis 不可用时不使用缓存；版本号在事务提交后递增，提交前的极短时间内其他 worker 仍可能使用旧数据，
+# 最长不超过 TOKEN_CACHE_TTL 秒
+token_cache = TTLCache(maxsize=getattr(Config, 'TOKEN_CACHE_SIZE', 10000),
+                       ttl=getattr(Config, 'TOKEN_CACHE_TTL', 60))
+# {表名} 为 redis 集群的 hash tag，同一张表的版本号在同一个 slot，可以一次 MGET
+TOKEN_VERSION_KEY = 'token_version:{{{}}}'
+_serializers = {}
+
+
+def get_serializer(secret_key, expires_in=None):
+    '''按 (secret_key, expires_in) 复用 Serializer 实例'''
+    key = (secret_key, expires_in)
+    s = _serializers.get(key)
+    if s is None:
+        s = Serializer(secret_key, expires_in=expires_in)
+        _serializers[key] = s
+    return s
+
+
+def load_token(secret_key, token):
+    '''
+    校验 token，返回 (data, 过期时间戳)，无效或过期时返回 (None, None)
+    '''
+    try:
+        data, header = get_serializer(secret_key).loads(token, return_header=True)
+    except SignatureExpired:
+        return None, None  # valid token, but expired
+    except BadSignature:
+        return None, None  # invalid token
+    return data, header.get('exp')
+
+
+def token_digest(token):
+    if isinstance(token, str):
+        token = token.encode('utf-8')
+    return hashlib.sha256(token).digest()
+
+
+def token_version_keys(table, id):
+    '''整表（批量更新时递增）与单个用户的版本号 key'''
+    key = TOKEN_VERSION_KEY.format(table)
+    return key, '{}:{}'.format(key, id)
+
+
+def token_versions(table, id):
+    '''读取版本号，redis 不可用时返回 None'''
+    try:
+        return tuple(redis_store.mget(token_version_keys(table, id)))
+    except Exception:
+        return None
+
+
+def cache_user(kind, token, user, expire_at):
+    '''缓存 token 对应的用户字段快照'''
+    versions = token_versions(user.__tablename__, user.id)
+    if versions is None:
+        return
+    values = {c.key: getattr(user, c.key) for c in user.__mapper__.column_attrs}
+    token_cache.set((kind, token_digest(token)), (values, versions), expire_at=expire_at,
+                    tag=(user.__tablename__, user.id))
+
+
+def cached_user(cls, kind, token):
+    '''从缓存恢复用户对象并关联到当前 session，只读取 redis 中的版本号，不访问数据库'''
+    key = (kind, token_digest(token))
+    item = token_cache.get(key)
+    if item is None:
+        return None
+    values, versions = item
+    if token_versions(cls.__tablename__, values['id']) != versions:
+        token_cache.delete(key)
+        return None
+    user = cls(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def invalidate_user_tokens(table, id=None):
+    '''
+    使用户已缓存的 token 在所有 worker 上失效，id 为 None 时使整张表失效
+
+    :param table: 表名
+    :param id: 用户id
+    '''
+    if id is None:
+        token_cache.clear()
+        key = TOKEN_VERSION_KEY.format(table)
+    else:
+        token_cache.invalidate_tag((table, id))
+        key = token_version_keys(table, id)[1]
+    redis_store.incr(key)
+
+
 class BaseMixin(object):
     def __getitem__(self, key):
         return getattr(self, key)
@@ -29,6 +128,29 @@ class TimestampMixin(object):
         return self.updateat.strftime('%Y-%m-%d %H:%M:%S')
 
 
+class GeometryMixin(object):
+    '''坐标点集解析缓存，要求模型包含 latlgs、updateat 字段'''
+
+    @property
+    def points(self):
+        '''解析后的坐标数组 (n, 2)，[经度, 纬度]'''
+        return geometry_cache.get(self.__tablename__, self.id, self.updateat, lambda: self.latlgs)
+
+    @classmethod
+    def get_points(cls, id):
+        '''
+        按id获取解析后的坐标数组，缓存命中时只查询 updateat，不读取坐标字符串
+
+        :param id: 记录id
+        '''
+        updateat = db.session.query(cls.updateat).filter(cls.id == id).scalar()
+        if updateat is None:
+            return None
+        return geometry_cache.get(
+            cls.__tablename__, id, updateat,
+            lambda: db.session.query(cls.latlgs).filter(cls.id == id).scalar())
+
+
 class Base(db.Model, BaseMixin):
     __abstract__ = True
 
@@ -43,23 +165,24 @@ class User(db.Model):
     pwd = db.Column(db.String(255), index=True, nullable=False)
 
     def generate_user_token(self, expiration=Config.EXPIRATION):
-        s = Serializer(Config.SECRET_KEY, expires_in=expiration)
+        s = get_serializer(Config.SECRET_KEY, expires_in=expiration)
         return s.dumps({'id': self.id, 'username': self.username}).decode('utf-8')
 
     @staticmethod
     def verify_user_token(token):
-        s = Serializer(Config.SECRET_KEY, expires_in=Config.EXPIRATION)
-        try:
-            data = s.loads(token)
-        except SignatureExpired:
-            return None  # valid token, but expired
-        except BadSignature:
-            return None  # invalid token
+        user = cached_user(User, 'user', token)
+        if user is not None:
+            return user
+        data, expire_at = load_token(Config.SECRET_KEY, token)
+        if data is None:
+            return None
         user = User.query.get(data['id'])
+        if user is not None:
+            cache_user('user', token, user, expire_at)
         return user
 
 
-class Car(Base):
+class Car(Base, TimestampMixin):
     '''车辆信息表'''
     __tablename__ = 'car'
 
@@ -102,7 +225,8 @@ class Car(Base):
             'devicekey': self.devicekey,
             'devicesecret': self.devicesecret,
             'productkey': self.productkey,
-            'deviceaddtime': self.deviceaddtime,
+            # 设备添加时间即车辆创建时间
+            'deviceaddtime': self.created_time,
             'createat': self.created_time,
             'updateat': self.updated_time,
         }
@@ -136,6 +260,12 @@ class PlatformInfo(db.Model):
 
 class ConnectDevice(db.Model):
     __tablename__ = 'conn_info'
+    # 游标分页使用的索引，见 migrations/001_history_keyset_indexes.sql
+    __table_args__ = (
+        Index('idx_conn_info_car_create_at', 'car_id', 'create_at'),
+        Index('idx_conn_info_car_begin_time', 'car_id', 'begin_time'),
+        Index('idx_conn_info_create_at', 'create_at'),
+    )
     id = db.Column(db.Integer, primary_key=True, comment='车辆id')
     car_id = db.Column(db.Integer, index=True, nullable=False, comment='车辆id')
     plat_id = db.Column(db.Integer, index=True, nullable=False, comment='台架id')
@@ -148,6 +278,19 @@ class ConnectDevice(db.Model):
     end_time = db.Column(TIMESTAMP, nullable=False, comment='结束时间')
     type = db.Column(TINYINT(3), nullable=False, comment='类型（1、单独远程，2、自动任务下远程）')
 
+    def to_dict(self):
+        resp_dict = {
+            'id': self.id,
+            'car_id': self.car_id,
+            'plat_id': self.plat_id,
+            'conn_status': self.conn_status,
+            'create_at': self.create_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'begin_time': self.begin_time,
+            'end_time': self.end_time,
+            'type': self.type,
+        }
+        return resp_dict
+
 
 class DataServerConfig(db.Model):
     __tablename__ = 'data_server_config'
@@ -172,29 +315,28 @@ class UserBase(db.Model):
 
     def generate_user_token(self, expiration=Config.APP_EXPIRATION):
         secret_key = Config.SECRET_KEY if self.__class__.__name__ == 'UserInfo' else Config.SECRET_KEY + 'for_service'
-        s = Serializer(secret_key, expires_in=expiration)
+        s = get_serializer(secret_key, expires_in=expiration)
         return s.dumps({'id': self.id, 'user_name': self.user_name}).decode(
             'utf-8')
 
     @staticmethod
     def verify_user_token(token, is_service_user=False):
-        secret_key = Config.SECRET_KEY if not is_service_user \
-            else Config.SECRET_KEY + 'for_service'
-        s = Serializer(secret_key)
-        try:
-            data = s.loads(token)
-        except SignatureExpired:
-            return None  # valid token, but expired
-        except BadSignature:
-            return None  # invalid token
-
-        if is_service_user:
-            user = db.session.query(ServiceUserInfo).filter(
-                ServiceUserInfo.id == data['id']
-            ).first()
-            if user and user.user_name == data['user_name']:
-                return user
-        return None  # maybe for service
+        if not is_service_user:
+            return None  # maybe for service
+
+        user = cached_user(ServiceUserInfo, 'service', token)
+        if user is not None:
+            return user
+        data, expire_at = load_token(Config.SECRET_KEY + 'for_service', token)
+        if data is None:
+            return None
+        user = db.session.query(ServiceUserInfo).filter(
+            ServiceUserInfo.id == data['id']
+        ).first()
+        if user and user.user_name == data['user_name']:
+            cache_user('service', token, user, expire_at)
+            return user
+        return None
 
 
 class ServiceUserInfo(UserBase):
@@ -223,6 +365,44 @@ class ServiceUserInfo(UserBase):
         }
 
 
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+@event.listens_for(ServiceUserInfo, 'after_update')
+@event.listens_for(ServiceUserInfo, 'after_delete')
+def invalidate_user_cache(mapper, connection, target):
+    # 本进程立即失效，其他 worker 在事务提交后通过版本号失效
+    token_cache.invalidate_tag((target.__tablename__, target.id))
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('token_invalidations', set()).add((target.__tablename__, target.id))
+
+
+@event.listens_for(db.session, 'after_bulk_update')
+@event.listens_for(db.session, 'after_bulk_delete')
+def invalidate_user_cache_bulk(update_context):
+    '''query.update()/delete() 不触发 mapper 事件，无法知道影响了哪些用户，使整张表失效'''
+    mapper = getattr(update_context, 'mapper', None)
+    if mapper is not None and mapper.class_ in (User, ServiceUserInfo):
+        token_cache.clear()
+        update_context.session.info.setdefault('token_invalidations', set()).add(
+            (mapper.class_.__tablename__, None))
+
+
+@event.listens_for(db.session, 'after_commit')
+def publish_user_invalidations(session):
+    for table, id in session.info.pop('token_invalidations', ()):
+        try:
+            invalidate_user_tokens(table, id)
+        except Exception:
+            # redis 不可用时缓存也不会被使用
+            pass
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_user_invalidations(session):
+    session.info.pop('token_invalidations', None)
+
+
 class CarType(Base):
     '''车辆类型信息表'''
     __tablename__ = 'cartype'
@@ -239,7 +419,7 @@ class CarType(Base):
         }
 
 
-class Map(Base, TimestampMixin):
+class Map(Base, TimestampMixin, GeometryMixin):
     '''高精度地图信息表'''
     __tablename__ = 'map'
 
@@ -269,7 +449,7 @@ class Map(Base, TimestampMixin):
         }
 
 
-class Operation(Base, TimestampMixin):
+class Operation(Base, TimestampMixin, GeometryMixin):
     '''作业区域信息表'''
     __tablename__ = 'operation'
 
@@ -282,6 +462,12 @@ class Operation(Base, TimestampMixin):
     createat = Column(TIMESTAMP, nullable=False, server_default=text(
         'CURRENT_TIMESTAMP'), comment='创建时间')
 
+    def update_coordinate(self):
+        '''根据 latlgs 重新计算中心点坐标，逐点解析，不构造坐标列表'''
+        stats = polygon_stats(iter_latlgs(self.latlgs))
+        self.coordinate = '{},{}'.format(stats['longitude'], stats['latitude'])
+        return stats
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -294,6 +480,28 @@ class Operation(Base, TimestampMixin):
         }
 
 
+@event.listens_for(Map, 'after_update')
+@event.listens_for(Map, 'after_delete')
+@event.listens_for(Operation, 'after_update')
+@event.listens_for(Operation, 'after_delete')
+def invalidate_geometry(mapper, connection, target):
+    geometry_cache.invalidate(target.__tablename__, target.id)
+
+
+@event.listens_for(Operation, 'before_insert')
+@event.listens_for(Operation, 'before_update')
+def recompute_coordinate(mapper, connection, target):
+    '''保存时 latlgs 有变化则重新计算中心点坐标，坐标点集无法计算中心点时保留原值'''
+    if not target.latlgs:
+        return
+    if target.coordinate and not inspect(target).attrs.latlgs.history.has_changes():
+        return
+    try:
+        target.update_coordinate()
+    except ValueError:
+        pass
+
+
 class Taskbase(Base, TimestampMixin):
     '''任务基础信息表'''
     __tablename__ = 'taskbase'
@@ -340,6 +548,12 @@ class Taskbase(Base, TimestampMixin):
 class Taskdetail(Base):
     '''任务详情表'''
     __tablename__ = 'taskdetail'
+    # 游标分页使用的索引，见 migrations/001_history_keyset_indexes.sql
+    __table_args__ = (
+        Index('idx_taskdetail_carid_createat', 'carid', 'createat'),
+        Index('idx_taskdetail_carid_begintime', 'carid', 'begintime'),
+        Index('idx_taskdetail_createat', 'createat'),
+    )
 
     id = Column(INTEGER(11), primary_key=True)
     taskid = Column(INTEGER(11), nullable=False, comment='任务名称')
@@ -371,6 +585,12 @@ class Taskdetail(Base):
 class CarEveryday(Base):
     '''车辆每日工作信息表'''
     __tablename__ = 'car_everyday'
+    # 每辆车每天一行，每日汇总（demo_text/utils/rollup.py）按该唯一索引写入，
+    # 见 migrations/001_history_keyset_indexes.sql、002_car_everyday_unique_day.sql
+    __table_args__ = (
+        Index('uk_car_everyday_car_datatime', 'car_id', 'datatime', unique=True),
+        Index('idx_car_everyday_datatime', 'datatime'),
+    )
 
     id = Column(INTEGER(11), primary_key=True)
     car_id = Column(INTEGER(11), nullable=False, comment='carid')
@@ -0,0 +1,217 @@
+'''
+只读列表接口使用的轻量行记录
+
+只查询需要的列（Core select），结果直接构造成 namedtuple 记录（__slots__ 为空，无实例字典），
+不经过 ORM 实例化和 identity map，to_dict 输出与对应模型的 to_dict 一致
+usage:
+    rows = fetch(CarRow, Car.cardel == 1, order_by=Car.id)
+    return Response.success([row.to_dict() for row in rows])
+
+benchmark（需要可连接的数据库）:
+    python -m demo_text.models.projections [rows]
+'''
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+from sqlalchemy import and_, select
+
+from demo_text import db
+from demo_text.models.models import Car, Map, Operation, Taskbase, Taskdetail
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def format_time(value):
+    return value.strftime(DATETIME_FORMAT) if value is not None else None
+
+
+def projection(model, fields):
+    '''
+    生成模型的行记录基类，子类实现 to_dict
+
+    :param model: 模型类
+    :param fields: 查询的列名
+    '''
+    base = namedtuple(model.__name__ + 'Record', fields)
+
+    class Projection(base):
+        __slots__ = ()
+
+        @classmethod
+        def columns(cls):
+            return [getattr(model, field) for field in cls._fields]
+
+    Projection.model = model
+    return Projection
+
+
+class CarRow(projection(Car, ('id', 'carnum', 'cartype', 'carstu', 'deviceid', 'devicekey', 'devicesecret',
+                              'productkey', 'createat', 'updateat'))):
+    __slots__ = ()
+
+    def to_dict(self):
+        created_time = format_time(self.createat)
+        return {
+            'id': self.id,
+            'carnum': self.carnum,
+            'cartype': self.cartype,
+            'carstu': self.carstu,
+            'deviceid': self.deviceid,
+            'devicekey': self.devicekey,
+            'devicesecret': self.devicesecret,
+            'productkey': self.productkey,
+            'deviceaddtime': created_time,
+            'createat': created_time,
+            'updateat': format_time(self.updateat),
+        }
+
+
+class MapRow(projection(Map, ('id', 'mapname', 'operationid', 'mapdetails', 'maptxturl', 'txtname', 'latlgs'))):
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            'mapname': self.mapname,
+            'operationid': self.operationid,
+            'mapdetails': self.mapdetails,
+            'maptxturl': self.maptxturl,
+            'txtname': self.txtname,
+            'latlgs': self.latlgs,
+        }
+
+
+class OperationRow(projection(Operation, ('id', 'operationname', 'latlgs', 'coordinate', 'mapgrade',
+                                          'createat', 'updateat'))):
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'operationname': self.operationname,
+            'latlgs': self.latlgs,
+            'coordinate': self.coordinate,
+            'mapgrade': self.mapgrade,
+            'createat': format_time(self.createat),
+            'updateat': format_time(self.updateat),
+        }
+
+
+class TaskbaseRow(projection(Taskbase, ('id', 'taskname', 'operationid', 'mapid', 'taskbegintime', 'taskfrequency',
+                                        'lighting', 'music', 'pattern', 'cyclenumber', 'tasktxt'))):
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            'taskname': self.taskname,
+            'operationid': self.operationid,
+            'mapid': self.mapid,
+            'taskbegintime': self.taskbegintime,
+            'taskfrequency': self.taskfrequency,
+            'lighting': self.lighting,
+            'music': self.music,
+            'pattern': self.pattern,
+            'cyclenumber': self.cyclenumber,
+            'tasktxt': self.tasktxt,
+        }
+
+
+class TaskdetailRow(projection(Taskdetail, ('id', 'taskid', 'carid', 'carnum', 'taskstu', 'begintime', 'endtime',
+                                            'taskfrequency', 'createat'))):
+    __slots__ = ()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'taskid': self.taskid,
+            'carid': self.carid,
+            'carnum': self.carnum,
+            'taskstu': self.taskstu,
+            'begintime': self.begintime,
+            'endtime': self.endtime,
+            'taskfrequency': self.taskfrequency,
+            'createat': format_time(self.createat),
+        }
+
+
+def statement(record, *criteria, order_by=None, limit=None):
+    '''
+    行记录对应的 Core 查询语句
+
+    :param record: 行记录类，如 CarRow
+    :param criteria: 过滤条件
+    :param order_by: 排序字段
+    :param limit: 行数
+    '''
+    stmt = select(record.columns())
+    if criteria:
+        stmt = stmt.where(and_(*criteria))
+    if order_by is not None:
+        stmt = stmt.order_by(order_by)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def fetch(record, *criteria, order_by=None, limit=None, session=None):
+    '''
+    查询并返回行记录列表，参数见 statement
+
+    :param session: 默认 db.session
+    '''
+    session = session or db.session
+    make = record._make
+    return [make(row) for row in session.execute(statement(record, *criteria, order_by=order_by, limit=limit))]
+
+
+def iterate(record, *criteria, order_by=None, batch_size=1000, session=None):
+    '''
+    使用服务端游标分批读取行记录，内存占用与结果行数无关，参数见 statement
+
+    :param batch_size: 每批读取的行数
+    :param session: 默认 db.session
+    '''
+    session = session or db.session
+    make = record._make
+    stmt = statement(record, *criteria, order_by=order_by).execution_options(stream_results=True)
+    result = session.execute(stmt)
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield make(row)
+    finally:
+        result.close()
+
+
+def benchmark(rows=10000, out=sys.stdout):
+    '''
+    对比 ORM 实例 + to_dict 与行记录 + to_dict 的耗时和内存峰值，数据来自当前配置的数据库
+    '''
+    from demo_text import create_app
+
+    app = create_app()
+    with app.app_context():
+        for record in (TaskdetailRow, CarRow, OperationRow, TaskbaseRow):
+            model = record.model
+            for name, load in (
+                    ('orm', lambda: model.query.order_by(model.id).limit(rows).all()),
+                    ('projection', lambda: fetch(record, order_by=model.id, limit=rows))):
+                db.session.expunge_all()
+                tracemalloc.start()
+                start = time.perf_counter()
+                items = load()
+                data = [item.to_dict() for item in items]
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                out.write('{:<12} {:<12} {:>6} rows {:>9.1f} ms {:>9.1f} KiB peak\n'.format(
+                    model.__tablename__, name, len(data), elapsed * 1000, peak / 1024.0))
+                del items, data
+
+
+if __name__ == '__main__':
+    benchmark(rows=int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,78 @@
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class TTLCache(object):
+    '''
+    线程安全的有界过期缓存
+    每个条目有独立的过期时间，超出 maxsize 时淘汰最久未使用的条目；
+    条目可附带 tag，按 tag 批量失效
+    '''
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._tags = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expire_at, _ = item
+            if expire_at <= time.time():
+                self._discard(key)
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, expire_at=None, tag=None):
+        '''
+        :param key: 缓存键
+        :param value: 缓存值
+        :param expire_at: 过期时间戳，不超过 now + ttl
+        :param tag: 失效标签
+        '''
+        max_expire_at = time.time() + self.ttl
+        if expire_at is None or expire_at > max_expire_at:
+            expire_at = max_expire_at
+        with self._lock:
+            self._discard(key)
+            self._items[key] = (value, expire_at, tag)
+            if tag is not None:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._items) > self.maxsize:
+                self._discard(next(iter(self._items)))
+
+    def delete(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def _discard(self, key):
+        item = self._items.pop(key, None)
+        if item is None:
+            return
+        tag = item[2]
+        if tag is not None:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
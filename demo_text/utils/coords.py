@@ -0,0 +1,283 @@
+'''
+坐标系转换: WGS-84、GCJ-02（火星坐标）、BD-09（百度坐标），*_many 为批量（numpy 向量化）版本
+
+benchmark:
+    python -m demo_text.utils.coords [points]
+'''
+import math
+import sys
+import time
+
+import numpy as np
+
+
+class WGS84ToBD09(object):
+    def __init__(self):
+        self.x_pi = 3.14159265358979324 * 3000.0 / 180.0
+        self.pi = 3.1415926535897932384626  # π
+        self.a = 6378245.0  # 长半轴
+        self.ee = 0.00669342162296594323  # 偏心率平方
+
+    def gcj02_to_bd09(self, lng, lat):
+        """
+        火星坐标系(GCJ-02)转百度坐标系(BD-09)
+        谷歌、高德——>百度
+        :param lng:火星坐标经度
+        :param lat:火星坐标纬度
+        :return:
+        """
+        z = math.sqrt(lng * lng + lat * lat) + 0.00002 * math.sin(
+            lat * self.x_pi)
+        theta = math.atan2(lat, lng) + 0.000003 * math.cos(lng * self.x_pi)
+        bd_lng = z * math.cos(theta) + 0.0065
+        bd_lat = z * math.sin(theta) + 0.006
+        return [bd_lng, bd_lat]
+
+    def bd09_to_gcj02(self, bd_lon, bd_lat):
+        """
+        百度坐标系(BD-09)转火星坐标系(GCJ-02)
+        百度——>谷歌、高德
+        :param bd_lat:百度坐标纬度
+        :param bd_lon:百度坐标经度
+        :return:转换后的坐标列表形式
+        """
+        x = bd_lon - 0.0065
+        y = bd_lat - 0.006
+        z = math.sqrt(x * x + y * y) - 0.00002 * math.sin(y * self.x_pi)
+        theta = math.atan2(y, x) - 0.000003 * math.cos(x * self.x_pi)
+        gg_lng = z * math.cos(theta)
+        gg_lat = z * math.sin(theta)
+        return [gg_lng, gg_lat]
+
+    def gcj02_to_wgs84(self, lng, lat):
+        """
+        GCJ02(火星坐标系)转GPS84
+        :param lng:火星坐标系的经度
+        :param lat:火星坐标系纬度
+        :return:
+        """
+        if self.out_of_china(lng, lat):
+            return [lng, lat]
+        dlat = self._transformlat(lng - 105.0, lat - 35.0)
+        dlng = self._transformlng(lng - 105.0, lat - 35.0)
+        radlat = lat / 180.0 * self.pi
+        magic = math.sin(radlat)
+        magic = 1 - self.ee * magic * magic
+        sqrtmagic = math.sqrt(magic)
+        dlat = (dlat * 180.0) / (
+                (self.a * (1 - self.ee)) / (magic * sqrtmagic) * self.pi)
+        dlng = (dlng * 180.0) / (
+                self.a / sqrtmagic * math.cos(radlat) * self.pi)
+        mglat = lat + dlat
+        mglng = lng + dlng
+        return [lng * 2 - mglng, lat * 2 - mglat]
+
+    def wgs84_to_gcj02(self, lng, lat):
+        """
+        WGS84转GCJ02(火星坐标系)
+        :param lng:WGS84坐标系的经度
+        :param lat:WGS84坐标系的纬度
+        :return:
+        """
+        if self.out_of_china(lng, lat):  # 判断是否在国内
+            return [lng, lat]
+        dlat = self._transformlat(lng - 105.0, lat - 35.0)
+        dlng = self._transformlng(lng - 105.0, lat - 35.0)
+        radlat = lat / 180.0 * self.pi
+        magic = math.sin(radlat)
+        magic = 1 - self.ee * magic * magic
+        sqrtmagic = math.sqrt(magic)
+        dlat = (dlat * 180.0) / (
+                (self.a * (1 - self.ee)) / (magic * sqrtmagic) * self.pi)
+        dlng = (dlng * 180.0) / (
+                self.a / sqrtmagic * math.cos(radlat) * self.pi)
+        mglat = lat + dlat
+        mglng = lng + dlng
+        return [mglng, mglat]
+
+    def wgs84_to_bd09(self, lon, lat):
+        lon, lat = self.wgs84_to_gcj02(lon, lat)
+        return self.gcj02_to_bd09(lon, lat)
+
+    def bd09_to_wgs84(self, bd_lon, bd_lat):
+        lon, lat = self.bd09_to_gcj02(bd_lon, bd_lat)
+        return self.gcj02_to_wgs84(lon, lat)
+
+    def _transformlat(self, lng, lat):
+        ret = -100.0 + 2.0 * lng + 3.0 * lat + 0.2 * lat * lat + \
+              0.1 * lng * lat + 0.2 * math.sqrt(math.fabs(lng))
+        ret += (20.0 * math.sin(6.0 * lng * self.pi) + 20.0 *
+                math.sin(2.0 * lng * self.pi)) * 2.0 / 3.0
+        ret += (20.0 * math.sin(lat * self.pi) + 40.0 *
+                math.sin(lat / 3.0 * self.pi)) * 2.0 / 3.0
+        ret += (160.0 * math.sin(lat / 12.0 * self.pi) + 320 *
+                math.sin(lat * self.pi / 30.0)) * 2.0 / 3.0
+        return ret
+
+    def _transformlng(self, lng, lat):
+        ret = 300.0 + lng + 2.0 * lat + 0.1 * lng * lng + \
+              0.1 * lng * lat + 0.1 * math.sqrt(math.fabs(lng))
+        ret += (20.0 * math.sin(6.0 * lng * self.pi) + 20.0 *
+                math.sin(2.0 * lng * self.pi)) * 2.0 / 3.0
+        ret += (20.0 * math.sin(lng * self.pi) + 40.0 *
+                math.sin(lng / 3.0 * self.pi)) * 2.0 / 3.0
+        ret += (150.0 * math.sin(lng / 12.0 * self.pi) + 300.0 *
+                math.sin(lng / 30.0 * self.pi)) * 2.0 / 3.0
+        return ret
+
+    def wgs84_to_gcj02_many(self, lngs, lats=None):
+        """
+        WGS84转GCJ02(火星坐标系)，批量版本
+        :param lngs:WGS84坐标系的经度数组；lats为None时为(n, 2)坐标数组或[lng, lat, ...]扁平缓冲区
+        :param lats:WGS84坐标系的纬度数组
+        :return:(经度数组, 纬度数组)
+        """
+        lng, lat = self._as_arrays(lngs, lats)
+        dlng, dlat = self._offset_many(lng, lat)
+        return lng + dlng, lat + dlat
+
+    def gcj02_to_wgs84_many(self, lngs, lats=None):
+        """
+        GCJ02(火星坐标系)转GPS84，批量版本
+        :param lngs:火星坐标系的经度数组
+        :param lats:火星坐标系纬度数组
+        :return:(经度数组, 纬度数组)
+        """
+        lng, lat = self._as_arrays(lngs, lats)
+        dlng, dlat = self._offset_many(lng, lat)
+        return lng - dlng, lat - dlat
+
+    def gcj02_to_bd09_many(self, lngs, lats=None):
+        """
+        火星坐标系(GCJ-02)转百度坐标系(BD-09)，批量版本
+        :param lngs:火星坐标经度数组
+        :param lats:火星坐标纬度数组
+        :return:(经度数组, 纬度数组)
+        """
+        lng, lat = self._as_arrays(lngs, lats)
+        z = np.sqrt(lng * lng + lat * lat) + 0.00002 * np.sin(lat * self.x_pi)
+        theta = np.arctan2(lat, lng) + 0.000003 * np.cos(lng * self.x_pi)
+        return z * np.cos(theta) + 0.0065, z * np.sin(theta) + 0.006
+
+    def bd09_to_gcj02_many(self, bd_lons, bd_lats=None):
+        """
+        百度坐标系(BD-09)转火星坐标系(GCJ-02)，批量版本
+        :param bd_lons:百度坐标经度数组
+        :param bd_lats:百度坐标纬度数组
+        :return:(经度数组, 纬度数组)
+        """
+        lng, lat = self._as_arrays(bd_lons, bd_lats)
+        x = lng - 0.0065
+        y = lat - 0.006
+        z = np.sqrt(x * x + y * y) - 0.00002 * np.sin(y * self.x_pi)
+        theta = np.arctan2(y, x) - 0.000003 * np.cos(x * self.x_pi)
+        return z * np.cos(theta), z * np.sin(theta)
+
+    def wgs84_to_bd09_many(self, lons, lats=None):
+        return self.gcj02_to_bd09_many(*self.wgs84_to_gcj02_many(lons, lats))
+
+    def bd09_to_wgs84_many(self, bd_lons, bd_lats=None):
+        return self.gcj02_to_wgs84_many(*self.bd09_to_gcj02_many(bd_lons, bd_lats))
+
+    @staticmethod
+    def _as_arrays(lngs, lats=None):
+        """
+        统一输入格式，返回float64的经度、纬度数组
+        """
+        if lats is not None:
+            return (np.asarray(lngs, dtype=np.float64).ravel(),
+                    np.asarray(lats, dtype=np.float64).ravel())
+        points = np.asarray(lngs, dtype=np.float64).reshape(-1, 2)
+        return points[:, 0], points[:, 1]
+
+    def _offset_many(self, lng, lat):
+        """
+        计算WGS84与GCJ02之间的偏移量，国外坐标偏移量为0
+        """
+        dlng = np.zeros_like(lng)
+        dlat = np.zeros_like(lat)
+        mask = ~self.out_of_china_many(lng, lat)
+        if not mask.any():
+            return dlng, dlat
+        m_lng = lng[mask]
+        m_lat = lat[mask]
+        d_lat = self._transformlat_many(m_lng - 105.0, m_lat - 35.0)
+        d_lng = self._transformlng_many(m_lng - 105.0, m_lat - 35.0)
+        radlat = m_lat / 180.0 * self.pi
+        magic = np.sin(radlat)
+        magic = 1 - self.ee * magic * magic
+        sqrtmagic = np.sqrt(magic)
+        dlat[mask] = (d_lat * 180.0) / (
+                (self.a * (1 - self.ee)) / (magic * sqrtmagic) * self.pi)
+        dlng[mask] = (d_lng * 180.0) / (
+                self.a / sqrtmagic * np.cos(radlat) * self.pi)
+        return dlng, dlat
+
+    def _transformlat_many(self, lng, lat):
+        ret = -100.0 + 2.0 * lng + 3.0 * lat + 0.2 * lat * lat + \
+              0.1 * lng * lat + 0.2 * np.sqrt(np.abs(lng))
+        ret += (20.0 * np.sin(6.0 * lng * self.pi) + 20.0 *
+                np.sin(2.0 * lng * self.pi)) * 2.0 / 3.0
+        ret += (20.0 * np.sin(lat * self.pi) + 40.0 *
+                np.sin(lat / 3.0 * self.pi)) * 2.0 / 3.0
+        ret += (160.0 * np.sin(lat / 12.0 * self.pi) + 320 *
+                np.sin(lat * self.pi / 30.0)) * 2.0 / 3.0
+        return ret
+
+    def _transformlng_many(self, lng, lat):
+        ret = 300.0 + lng + 2.0 * lat + 0.1 * lng * lng + \
+              0.1 * lng * lat + 0.1 * np.sqrt(np.abs(lng))
+        ret += (20.0 * np.sin(6.0 * lng * self.pi) + 20.0 *
+                np.sin(2.0 * lng * self.pi)) * 2.0 / 3.0
+        ret += (20.0 * np.sin(lng * self.pi) + 40.0 *
+                np.sin(lng / 3.0 * self.pi)) * 2.0 / 3.0
+        ret += (150.0 * np.sin(lng / 12.0 * self.pi) + 300.0 *
+                np.sin(lng / 30.0 * self.pi)) * 2.0 / 3.0
+        return ret
+
+    def out_of_china_many(self, lng, lat):
+        """
+        批量判断是否在国内，返回布尔数组
+        """
+        return ~((lng > 73.66) & (lng < 135.05) & (lat > 3.86) & (lat < 53.55))
+
+    def out_of_china(self, lng, lat):
+        """
+        判断是否在国内，不在国内不做偏移
+        :param lng:
+        :param lat:
+        :return:
+        """
+        return not (
+                lng > 73.66 and lng < 135.05 and lat > 3.86 and lat < 53.55)
+
+
+def benchmark(points=100000, out=sys.stdout):
+    '''
+    对比逐点转换与批量转换 wgs84_to_bd09 的耗时
+
+    :param points: 坐标点数，约 1/10 的点在国外
+    '''
+    converter = WGS84ToBD09()
+    rng = np.random.RandomState(0)
+    lngs = rng.uniform(60.0, 140.0, points)
+    lats = rng.uniform(0.0, 55.0, points)
+    pairs = list(zip(lngs.tolist(), lats.tolist()))
+
+    start = time.perf_counter()
+    for lng, lat in pairs:
+        converter.wgs84_to_bd09(lng, lat)
+    scalar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    converter.wgs84_to_bd09_many(lngs, lats)
+    vectorized = time.perf_counter() - start
+
+    out.write('{:<12} {:>9.1f} ms ({} points)\n'.format('scalar', scalar * 1000, points))
+    out.write('{:<12} {:>9.1f} ms ({} points), {:.0f}x\n'.format(
+        'vectorized', vectorized * 1000, points, scalar / vectorized))
+    return scalar, vectorized
+
+
+if __name__ == '__main__':
+    benchmark(points=int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -1,45 +1,162 @@
 
 import contextlib
+import time
 
 from sqlalchemy import create_engine
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
 
 from settings import Config
 
 
+class TimedQueuePool(QueuePool):
+    '''记录获取连接等待时间的连接池'''
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = self.__dict__.setdefault('wait_stats', {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += elapsed
+            if elapsed > stats['max']:
+                stats['max'] = elapsed
+
+
+def engine_options():
+    '''与 Flask-SQLAlchemy 共用的连接池配置'''
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': getattr(Config, 'SQLALCHEMY_POOL_SIZE', 5),
+        'max_overflow': getattr(Config, 'SQLALCHEMY_MAX_OVERFLOW', 10),
+        'pool_timeout': getattr(Config, 'SQLALCHEMY_POOL_TIMEOUT', 30),
+        'pool_recycle': getattr(Config, 'SQLALCHEMY_POOL_RECYCLE', 3600),
+        'pool_pre_ping': True,
+    }
+
+
+def pool_status(engine):
+    '''连接池状态: 大小、空闲、占用、溢出连接数及等待时间'''
+    pool = engine.pool
+    status = {
+        'size': pool.size(),
+        'checkedin': pool.checkedin(),
+        'checkedout': pool.checkedout(),
+        'overflow': pool.overflow(),
+    }
+    wait_stats = getattr(pool, 'wait_stats', None)
+    if wait_stats is not None:
+        status['wait_count'] = wait_stats['count']
+        status['wait_total'] = wait_stats['total']
+        status['wait_max'] = wait_stats['max']
+    return status
+
+
 class DBManager(object):
+    '''
+    数据库会话管理
+    写操作使用 MASTER，只读操作（session_ctx(readonly=True)）使用 DEFAULT；
+    传入 flask app 和 db 时，与 Flask-SQLAlchemy 使用同一 url 的库直接复用其 engine，
+    不再另建连接池
+    '''
 
-    def __init__(self):
+    def __init__(self, app=None, db=None):
         self.master_session = None
+        self.slave_session = None
+        self.engines = {}
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db=None):
+        if db is not None:
+            self.engines[app.config['SQLALCHEMY_DATABASE_URI']] = db.get_engine(app)
         self.create_sessions()
 
     def create_sessions(self):
         self.master_session = self.create_single_session(
             Config.MASTER_DATABASE_URI)
+        if Config.SQLALCHEMY_DATABASE_URI == Config.MASTER_DATABASE_URI:
+            self.slave_session = self.master_session
+        else:
+            self.slave_session = self.create_single_session(
+                Config.SQLALCHEMY_DATABASE_URI)
 
-    @classmethod
-    def create_single_session(cls, url, scopefunc=None):
-        engine = create_engine(url, echo=False)
+    def get_engine(self, url):
+        engine = self.engines.get(url)
+        if engine is None:
+            engine = create_engine(url, echo=False, **engine_options())
+            self.engines[url] = engine
+        return engine
+
+    def create_single_session(self, url, scopefunc=None):
+        engine = self.get_engine(url)
         session_factory = sessionmaker(expire_on_commit=True, bind=engine)
         Session = scoped_session(session_factory, scopefunc=scopefunc)
         return Session
 
-    def get_session(self):
+    def get_session(self, readonly=False):
+        if self.master_session is None:
+            self.create_sessions()
+        if readonly and self.slave_session:
+            return self.slave_session
         if self.master_session:
             return self.master_session
         else:
             raise IndexError('cannot get master_session from DB_SETTING')
 
     @contextlib.contextmanager
-    def session_ctx(self):
-        DBSession = self.get_session()
+    def session_ctx(self, readonly=False):
+        '''
+        :param readonly: 只读会话，使用 DEFAULT 库且不提交
+        '''
+        DBSession = self.get_session(readonly=readonly)
         session = DBSession()
         try:
             yield session
-            session.commit()
+            if readonly:
+                session.rollback()
+            else:
+                session.commit()
         except Exception as e:
             session.rollback()
             raise
         finally:
             session.expunge_all()
             session.close()
+
+    def pool_status(self):
+        '''各数据库连接池状态，用于监控'''
+        result = {}
+        urls = {'master': Config.MASTER_DATABASE_URI, 'default': Config.SQLALCHEMY_DATABASE_URI}
+        for name, url in urls.items():
+            engine = self.engines.get(url)
+            if engine is not None:
+                result[name] = pool_status(engine)
+        return result
+
+    def pool_metrics(self):
+        '''连接池状态，Prometheus 文本格式'''
+        metrics = {}
+        for name, status in self.pool_status().items():
+            for key, value in status.items():
+                metrics.setdefault(key, []).append('db_pool_{}{{database="{}"}} {}'.format(key, name, value))
+        lines = []
+        for key, samples in metrics.items():
+            lines.append('# TYPE db_pool_{} gauge'.format(key))
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def yield_per(query, batch_size=1000):
+    '''
+    分批读取查询结果，使用服务端游标，内存占用与结果行数无关
+    usage:
+        for row in yield_per(Taskdetail.query.order_by(Taskdetail.id)):
+            ...
+
+    :param query: orm 查询
+    :param batch_size: 每批从数据库读取的行数
+    '''
+    return query.execution_options(stream_results=True).yield_per(batch_size)
@@ -0,0 +1,99 @@
+'''
+响应 json 编码
+
+默认使用 orjson，未安装时退回标准库 json。datetime 按 DATETIME_FORMAT 输出，
+date 按 DATE_FORMAT 输出，Decimal 转为 float，模型字段可以直接放进响应数据，不必手动 strftime。
+
+benchmark:
+    python -m demo_text.utils.encoder [rows]
+'''
+import datetime
+import decimal
+import json
+import sys
+import timeit
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def default(obj):
+    '''json 不支持的类型的转换'''
+    if isinstance(obj, datetime.datetime):
+        return obj.strftime(DATETIME_FORMAT)
+    if isinstance(obj, datetime.date):
+        return obj.strftime(DATE_FORMAT)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'tolist'):
+        # numpy 数组及标量
+        return obj.tolist()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(obj).__name__))
+
+
+class StdJSONEncoder(object):
+    '''标准库 json，紧凑输出，中文不转义'''
+    name = 'json'
+
+    def dumps(self, obj):
+        return json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonEncoder(object):
+    '''orjson，datetime 交给 default 处理以保持与 DATETIME_FORMAT 一致'''
+    name = 'orjson'
+
+    def __init__(self):
+        self.option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=default, option=self.option)
+
+
+def default_encoder():
+    return OrjsonEncoder() if orjson is not None else StdJSONEncoder()
+
+
+def benchmark(rows=500, number=200, out=sys.stdout):
+    '''
+    对比 flask 默认的编码方式（标准库 json，ASCII 转义，key 排序）与各编码器，数据模拟列表接口返回的 to_dict 结果
+
+    :param rows: 每个响应的行数
+    :param number: 每个编码器的执行次数
+    '''
+    now = datetime.datetime(2020, 5, 1, 8, 30, 0)
+    data = [{
+        'id': i,
+        'taskname': u'任务{}'.format(i),
+        'carid': i % 50,
+        'begintime': now.strftime(DATETIME_FORMAT),
+        'endtime': now.strftime(DATETIME_FORMAT),
+        'caratime': 3600 + i,
+        'carmileage': 12.5 * i,
+        'coordinate': '116.397128,39.916527',
+        'status': 1,
+    } for i in range(rows)]
+    res = {'code': 200, 'msg': u'操作成功', 'data': data}
+
+    encoders = [('flask jsonify (json, ascii)', lambda obj: json.dumps(obj, separators=(',', ':'), sort_keys=True))]
+    encoders.append(('std', StdJSONEncoder().dumps))
+    if orjson is not None:
+        encoders.append(('orjson', OrjsonEncoder().dumps))
+
+    results = {}
+    for name, dumps in encoders:
+        seconds = min(timeit.repeat(lambda: dumps(res), number=number, repeat=3)) / number
+        results[name] = seconds
+        out.write('{:<30} {:>10.1f} us/response ({} rows)\n'.format(name, seconds * 1e6, rows))
+    return results
+
+
+if __name__ == '__main__':
+    benchmark(rows=int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,246 @@
+
+import json
+import re
+import struct
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+from settings import Config
+
+_SPLIT_PATTERN = re.compile(r'[\s,;]+')
+_NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?')
+
+
+def parse_latlgs(latlgs):
+    '''
+    解析坐标点集字符串，返回 (n, 2) 的 float64 数组，每行为 [经度, 纬度]
+    支持格式:
+        '[[lng, lat], [lng, lat]]'
+        '[{"lng": lng, "lat": lat}, ...]'
+        'lng,lat;lng,lat'
+    :param latlgs: 坐标点集字符串
+    '''
+    if not latlgs:
+        return np.empty((0, 2), dtype=np.float64)
+
+    text = latlgs.strip()
+    if text.startswith('['):
+        points = json.loads(text)
+        if points and isinstance(points[0], dict):
+            points = [(p.get('lng', p.get('longitude')), p.get('lat', p.get('latitude')))
+                      for p in points]
+        return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+    values = [v for v in _SPLIT_PATTERN.split(text) if v]
+    return np.asarray(values, dtype=np.float64).reshape(-1, 2)
+
+
+def iter_latlgs(latlgs):
+    '''
+    逐点解析坐标点集字符串，生成 (经度, 纬度)，不构造完整列表
+
+    :param latlgs: 坐标点集字符串，格式同 parse_latlgs
+    '''
+    if not latlgs:
+        return
+    if '"lat' in latlgs or '"lng' in latlgs:
+        # 对象格式字段顺序不固定，按 JSON 解析
+        for lng, lat in parse_latlgs(latlgs):
+            yield float(lng), float(lat)
+        return
+
+    numbers = _NUMBER_PATTERN.finditer(latlgs)
+    for lng in numbers:
+        lat = next(numbers, None)
+        if lat is None:
+            raise ValueError('latlgs has an odd number of values')
+        yield float(lng.group()), float(lat.group())
+
+
+def polygon_stats(dots):
+    '''
+    单次遍历计算多边形的中心点、有向面积和外包矩形，内存占用 O(1)
+
+    :param dots: 可迭代的 (经度, 纬度) 序列，可为生成器
+    :raises ValueError: 没有坐标点或面积为 0
+    :return: {'longitude', 'latitude', 'area', 'bbox': (min_lng, min_lat, max_lng, max_lat)}
+    '''
+    area = 0.0
+    cp_lng, cp_lat = 0.0, 0.0
+    first = prev = None
+    min_lng = min_lat = float('inf')
+    max_lng = max_lat = float('-inf')
+    for dot in dots:
+        lng = float(dot[0])  # 经度
+        lat = float(dot[1])  # 纬度
+        if prev is None:
+            first = (lng, lat)
+        else:
+            fg = (lat * prev[0] - lng * prev[1]) / 2.0
+            area += fg
+            cp_lat += fg * (lat + prev[1]) / 3.0
+            cp_lng += fg * (lng + prev[0]) / 3.0
+        prev = (lng, lat)
+        if lng < min_lng:
+            min_lng = lng
+        if lng > max_lng:
+            max_lng = lng
+        if lat < min_lat:
+            min_lat = lat
+        if lat > max_lat:
+            max_lat = lat
+
+    if prev is None:
+        raise ValueError('polygon has no vertex')
+    # 闭合: 首点与末点构成的边
+    lng, lat = first
+    fg = (lat * prev[0] - lng * prev[1]) / 2.0
+    area += fg
+    cp_lat += fg * (lat + prev[1]) / 3.0
+    cp_lng += fg * (lng + prev[0]) / 3.0
+
+    if area == 0.0:
+        raise ValueError('polygon has zero area')
+    return {
+        'longitude': cp_lng / area,
+        'latitude': cp_lat / area,
+        'area': area,
+        'bbox': (min_lng, min_lat, max_lng, max_lat),
+    }
+
+
+def polygon_stats_array(points):
+    '''
+    polygon_stats 的向量化版本，异常与 polygon_stats 相同
+
+    :param points: (n, 2) 坐标数组
+    '''
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        raise ValueError('polygon has no vertex')
+    lng, lat = points[:, 0], points[:, 1]
+    lng1, lat1 = np.roll(lng, 1), np.roll(lat, 1)
+    fg = (lat * lng1 - lng * lat1) / 2.0
+    area = fg.sum()
+    if area == 0.0:
+        raise ValueError('polygon has zero area')
+    return {
+        'longitude': float((fg * (lng + lng1)).sum() / 3.0 / area),
+        'latitude': float((fg * (lat + lat1)).sum() / 3.0 / area),
+        'area': float(area),
+        'bbox': (float(lng.min()), float(lat.min()), float(lng.max()), float(lat.max())),
+    }
+
+
+class GeometryCache(object):
+    '''
+    坐标点集解析缓存
+    以 (表名, id) 为键缓存解析后的坐标数组，updateat 变化时自动失效，
+    按数组占用字节数做 LRU 淘汰
+    '''
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes or getattr(Config, 'GEOMETRY_CACHE_BYTES', 64 * 1024 * 1024)
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+    def get(self, table, id, updateat, loader):
+        '''
+        获取解析后的坐标数组，未命中时调用 loader 读取坐标字符串并解析
+
+        :param table: 表名
+        :param id: 记录id
+        :param updateat: 记录更新时间
+        :param loader: 无参函数，返回坐标点集字符串
+        '''
+        key = (table, id)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] == updateat:
+                self._items.move_to_end(key)
+                return item[1]
+
+        points = parse_latlgs(loader())
+        points.setflags(write=False)
+        self.put(table, id, updateat, points)
+        return points
+
+    def put(self, table, id, updateat, points):
+        key = (table, id)
+        with self._lock:
+            self._discard(key)
+            if points.nbytes > self.max_bytes:
+                return
+            self._items[key] = (updateat, points)
+            self._bytes += points.nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._bytes -= evicted.nbytes
+
+    def invalidate(self, table, id):
+        with self._lock:
+            self._discard((table, id))
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'items': len(self._items), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
+
+    def _discard(self, key):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1].nbytes
+
+
+geometry_cache = GeometryCache()
+
+
+PACKED_MAGIC = b'LLP1'
+PACKED_HEADER = struct.Struct('<4sI')
+PACKED_SCALE = 10 ** 7
+PACKED_MIMETYPE = 'application/x-latlgs-packed'
+
+
+def encode_points(points):
+    '''
+    将坐标数组编码为紧凑的二进制格式
+    格式: 'LLP1' + uint32 点数 + 逐点差分后的 int32 定点数 [经度, 纬度] (小端, 精度1e-7度)
+
+    :param points: (n, 2) 坐标数组
+    '''
+    fixed = np.rint(np.asarray(points, dtype=np.float64).reshape(-1, 2) * PACKED_SCALE).astype(np.int64)
+    deltas = np.diff(fixed, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    if deltas.size and (deltas.min() < -2 ** 31 or deltas.max() >= 2 ** 31):
+        raise ValueError('coordinate delta out of int32 range')
+    return PACKED_HEADER.pack(PACKED_MAGIC, len(fixed)) + deltas.astype('<i4').tobytes()
+
+
+def decode_points(data):
+    '''
+    解码 encode_points 生成的二进制数据，返回 (n, 2) 坐标数组
+
+    :param data: 二进制数据
+    '''
+    magic, count = PACKED_HEADER.unpack_from(data)
+    if magic != PACKED_MAGIC:
+        raise ValueError('invalid packed latlgs data')
+    deltas = np.frombuffer(data, dtype='<i4', count=count * 2, offset=PACKED_HEADER.size)
+    fixed = np.cumsum(deltas.reshape(-1, 2).astype(np.int64), axis=0)
+    return fixed / float(PACKED_SCALE)
+
+
+def encode_latlgs(latlgs):
+    '''坐标点集字符串 -> 二进制数据'''
+    return encode_points(parse_latlgs(latlgs))
+
+
+def decode_latlgs(data):
+    '''二进制数据 -> 坐标点集字符串 '[[lng, lat], ...]' '''
+    return json.dumps(decode_points(data).tolist())
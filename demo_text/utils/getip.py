@@ -1,9 +1,17 @@
 
 import socket
 import struct
+import threading
+import time
 
 from flask import request
 
+from settings import Config
+
+_host_ip = None
+_host_ip_long = None
+_refresh_thread = None
+
 
 def get_client_ip():
     try:
@@ -44,6 +52,51 @@ def get_local_ip():
     return local_ip if ('' != local_ip and None != local_ip) else '127.0.0.1'
 
 
+def resolve_host_ip():
+    '''解析并缓存本机IP，配置了 LOCAL_IP 时直接使用配置值'''
+    global _host_ip, _host_ip_long
+    ip = getattr(Config, 'LOCAL_IP', None) or get_local_ip()
+    _host_ip_long = ip2long(ip)
+    _host_ip = ip
+    return ip
+
+
+def get_host_ip():
+    '''获取缓存的本机IP，不做网络操作'''
+    if _host_ip is None:
+        resolve_host_ip()
+    return _host_ip
+
+
+def get_host_ip_long():
+    '''获取缓存的本机IP整数值'''
+    if _host_ip_long is None:
+        resolve_host_ip()
+    return _host_ip_long
+
+
+def start_host_ip_refresh(interval=None):
+    '''
+    启动后台线程定期刷新本机IP，配置了 LOCAL_IP 或间隔为 0 时不启动
+
+    :param interval: 刷新间隔（秒），默认取配置 LOCAL_IP_REFRESH_INTERVAL
+    '''
+    global _refresh_thread
+    if interval is None:
+        interval = getattr(Config, 'LOCAL_IP_REFRESH_INTERVAL', 0)
+    if not interval or getattr(Config, 'LOCAL_IP', None) or _refresh_thread is not None:
+        return None
+
+    def refresh():
+        while True:
+            time.sleep(interval)
+            resolve_host_ip()
+
+    _refresh_thread = threading.Thread(target=refresh, name='host-ip-refresh', daemon=True)
+    _refresh_thread.start()
+    return _refresh_thread
+
+
 def ip2long(ip):
     '''Convert an IP string to long'''
     packedIP = socket.inet_aton(ip)
@@ -0,0 +1,124 @@
+
+import contextlib
+import os
+import socket
+import threading
+import uuid
+
+from demo_text import redis_store
+
+# 只有持有者才能续期、释放
+_RENEW_SCRIPT = '''
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+'''
+_RELEASE_SCRIPT = '''
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+'''
+
+
+class LeaderLock(object):
+    '''
+    基于 redis 的 leader 选举
+    多个 worker 竞争同一个 key，持有者定期续期，续期失败或进程退出后由其他 worker 接管
+    每次获取成功 term 加 1，后台任务记录启动时的 term，通过 holds(term) 判断自己所属的任期是否仍然有效，
+    失去 leader 后很快重新获取时，上一任期的任务也会退出，不会与新任期的任务重复运行
+    '''
+
+    def __init__(self, name, ttl=10, redis=None):
+        '''
+        :param name: 锁名称
+        :param ttl: 锁过期时间（秒），持有者应每 ttl / 3 秒续期一次
+        :param redis: redis 客户端，默认 redis_store
+        '''
+        self.key = 'leader:{}'.format(name)
+        self.ttl = ttl
+        self.redis = redis or redis_store
+        self.token = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+        self.is_leader = False
+        self.term = 0
+        self._renew = self.redis.register_script(_RENEW_SCRIPT)
+        self._release = self.redis.register_script(_RELEASE_SCRIPT)
+
+    def acquire(self):
+        self.is_leader = bool(self.redis.set(self.key, self.token, nx=True, px=int(self.ttl * 1000)))
+        if self.is_leader:
+            self.term += 1
+        return self.is_leader
+
+    def holds(self, term):
+        '''
+        是否仍是 term 任期的 leader
+
+        :param term: 任务启动时的 lock.term
+        '''
+        return self.is_leader and self.term == term
+
+    def renew(self):
+        try:
+            self.is_leader = bool(self._renew(keys=[self.key], args=[self.token, int(self.ttl * 1000)]))
+        except Exception:
+            self.is_leader = False
+        return self.is_leader
+
+    def release(self):
+        try:
+            self._release(keys=[self.key], args=[self.token])
+        finally:
+            self.is_leader = False
+
+    @contextlib.contextmanager
+    def hold(self):
+        '''
+        已获取锁后执行耗时任务，期间在后台线程中每 ttl / 3 秒续期，退出时停止续期并释放锁
+        usage:
+            if lock.acquire():
+                with lock.hold():
+                    run()
+        '''
+        stop = threading.Event()
+
+        def keep_alive():
+            while not stop.wait(self.ttl / 3.0) and self.renew():
+                pass
+
+        thread = threading.Thread(target=keep_alive, name='renew-{}'.format(self.key), daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+            self.release()
+
+
+def run_as_leader(socketio, lock, target, logger=None):
+    '''
+    在后台竞争 leader，成为 leader 后启动 target(socketio, lock, term)，
+    target 应在 lock.holds(term) 为 False 时退出
+
+    :param socketio: SocketIO 实例
+    :param lock: LeaderLock
+    :param target: 后台任务
+    '''
+    interval = lock.ttl / 3.0
+    while True:
+        try:
+            if lock.acquire():
+                if logger:
+                    logger.info('became leader of %s', lock.key)
+                socketio.start_background_task(target, socketio, lock, lock.term)
+                while lock.renew():
+                    socketio.sleep(interval)
+                if logger:
+                    logger.warning('lost leadership of %s', lock.key)
+        except Exception as e:
+            lock.is_leader = False
+            if logger:
+                logger.error(e)
+        socketio.sleep(interval)
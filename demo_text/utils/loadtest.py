@@ -0,0 +1,178 @@
+'''
+多 worker Socket.IO 推送压测
+按 worker 数分别启动 N 个 socketio worker 进程（与 manage.py 相同的 eventlet + redis 消息队列配置），
+客户端平均连接到各 worker，外部进程通过消息队列广播 messages 条消息，统计:
+    emit/s      外部进程写入消息队列的速率
+    recv/s      全部客户端收到消息的总速率（扇出后的推送量）
+    p50/p95/p99 消息从发出到客户端收到的延迟
+需要可连接的 redis（SOCKETIO_MESSAGE_QUEUE）以及 eventlet、python-socketio 客户端
+usage:
+    python -m demo_text.utils.loadtest [max_workers] [clients] [messages]
+    python -m demo_text.utils.loadtest 8 200 1000
+'''
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from settings import Config
+
+NAMESPACE = '/info'
+EVENT = 'load_test'
+BASE_PORT = 19100
+
+
+# 与 manage.py 一样先 monkey_patch 再导入其他模块
+WORKER_SCRIPT = '''
+import sys
+import eventlet
+eventlet.monkey_patch()
+from demo_text.utils.loadtest import run_worker
+run_worker(int(sys.argv[1]))
+'''
+
+
+def run_worker(port):
+    '''单个 worker：只负责把消息队列中的消息推送给连接到本进程的客户端'''
+    from flask import Flask
+    from flask_socketio import SocketIO
+
+    app = Flask(__name__)
+    socketio = SocketIO(app, cors_allowed_origins='*', async_mode='eventlet',
+                        message_queue=Config.SOCKETIO_MESSAGE_QUEUE)
+
+    @socketio.on('connect', namespace=NAMESPACE)
+    def on_connect():
+        pass
+
+    socketio.run(app, host='127.0.0.1', port=port, log_output=False)
+
+
+def start_workers(count):
+    workers = []
+    for i in range(count):
+        port = BASE_PORT + i
+        workers.append((port, subprocess.Popen([sys.executable, '-c', WORKER_SCRIPT, str(port)])))
+    try:
+        for port, process in workers:
+            wait_port(port, process)
+    except Exception:
+        stop_workers(workers)
+        raise
+    return workers
+
+
+def stop_workers(workers):
+    for _, process in workers:
+        process.terminate()
+    for _, process in workers:
+        process.wait()
+
+
+def wait_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('worker on port {} did not start'.format(port))
+
+
+class LoadClient(object):
+    '''记录收到每条消息的延迟'''
+
+    def __init__(self, port, expected):
+        import socketio
+
+        self.expected = expected
+        self.latencies = []
+        self.done = threading.Event()
+        self.client = socketio.Client(reconnection=False)
+        self.client.on(EVENT, self.on_message, namespace=NAMESPACE)
+        self.client.connect('http://127.0.0.1:{}'.format(port), namespaces=[NAMESPACE], transports=['websocket'])
+
+    def on_message(self, data):
+        self.latencies.append(time.time() - data['ts'])
+        if len(self.latencies) >= self.expected:
+            self.done.set()
+
+    def close(self):
+        self.client.disconnect()
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def measure(workers, clients, messages, timeout=60):
+    '''
+    对已启动的 worker 执行一轮压测，返回统计结果
+
+    :param workers: start_workers 的返回值
+    :param clients: 客户端连接数
+    :param messages: 广播的消息条数
+    '''
+    from flask_socketio import SocketIO
+
+    ports = [port for port, _ in workers]
+    load_clients = [LoadClient(ports[i % len(ports)], messages) for i in range(clients)]
+    # 外部进程只写消息队列，与多 worker 下非 leader 进程的推送路径一致
+    emitter = SocketIO(message_queue=Config.SOCKETIO_MESSAGE_QUEUE)
+    try:
+        # 等待连接在各 worker 上完成订阅
+        time.sleep(1)
+        start = time.time()
+        for seq in range(messages):
+            emitter.emit(EVENT, {'seq': seq, 'ts': time.time()}, namespace=NAMESPACE)
+        emitted = time.time() - start
+        deadline = time.monotonic() + timeout
+        for client in load_clients:
+            client.done.wait(max(deadline - time.monotonic(), 0))
+        elapsed = time.time() - start
+    finally:
+        for client in load_clients:
+            client.close()
+
+    latencies = [latency for client in load_clients for latency in client.latencies]
+    return {
+        'workers': len(workers),
+        'clients': clients,
+        'emit_rate': messages / emitted if emitted else float('inf'),
+        'recv_rate': len(latencies) / elapsed if elapsed else float('inf'),
+        'delivered': len(latencies),
+        'expected': clients * messages,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+def benchmark(max_workers=4, clients=100, messages=500, out=sys.stdout):
+    '''
+    worker 数按 1、2、4 ... 增加到 max_workers，每档重新启动 worker 并输出一行结果
+    '''
+    out.write('{:>7} {:>7} {:>10} {:>10} {:>17} {:>9} {:>9} {:>9}\n'.format(
+        'workers', 'clients', 'emit/s', 'recv/s', 'delivered', 'p50 ms', 'p95 ms', 'p99 ms'))
+    count = 1
+    while count <= max_workers:
+        workers = start_workers(count)
+        try:
+            result = measure(workers, clients, messages)
+        finally:
+            stop_workers(workers)
+        out.write('{workers:>7} {clients:>7} {emit_rate:>10.0f} {recv_rate:>10.0f} {delivered:>8}/{expected:<8} '
+                  '{p50_ms:>9.1f} {p95_ms:>9.1f} {p99_ms:>9.1f}\n'.format(
+                      p50_ms=result['p50'] * 1000, p95_ms=result['p95'] * 1000, p99_ms=result['p99'] * 1000,
+                      **result))
+        out.flush()
+        count *= 2
+
+
+if __name__ == '__main__':
+    benchmark(*[int(arg) for arg in sys.argv[1:4]])
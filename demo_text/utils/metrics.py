@@ -0,0 +1,108 @@
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+QUANTILES = (0.5, 0.95, 0.99)
+
+# 单个接口统计项的下标
+COUNT, ERRORS, SIZE, DURATION, BUCKETS = range(5)
+
+
+class RequestMetrics(object):
+    '''
+    进程内的接口请求统计
+    每个接口一个列表 [请求数, 错误数, 响应字节数, 总耗时, 各桶计数]，
+    写入不加锁：服务运行在 eventlet 单线程协程模型下，协程不会在一次更新中途被切换
+    '''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._stats = {}
+
+    def observe(self, endpoint, duration, size=0, error=False):
+        '''
+        记录一次请求
+
+        :param endpoint: 接口名称
+        :param duration: 耗时（秒）
+        :param size: 响应字节数
+        :param error: 是否出错
+        '''
+        stats = self._stats.get(endpoint)
+        if stats is None:
+            stats = self._stats.setdefault(endpoint, [0, 0, 0, 0.0, [0] * len(self.buckets)])
+        stats[COUNT] += 1
+        stats[SIZE] += size
+        stats[DURATION] += duration
+        if error:
+            stats[ERRORS] += 1
+        for idx, bound in enumerate(self.buckets):
+            if duration <= bound:
+                stats[BUCKETS][idx] += 1
+                break
+
+    def quantile(self, endpoint, q):
+        '''根据直方图线性插值估算分位数（秒）'''
+        stats = self._stats.get(endpoint)
+        if not stats or not stats[COUNT]:
+            return None
+        rank = q * stats[COUNT]
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, stats[BUCKETS]):
+            if count and seen + count >= rank:
+                if bound == float('inf'):
+                    return lower
+                return lower + (bound - lower) * (rank - seen) / count
+            seen += count
+            if bound != float('inf'):
+                lower = bound
+        return lower
+
+    def reset(self):
+        self._stats = {}
+
+    def to_prometheus(self):
+        '''导出 Prometheus 文本格式'''
+        stats = {endpoint: (item[:BUCKETS] + [list(item[BUCKETS])])
+                 for endpoint, item in list(self._stats.items())}
+        lines = []
+
+        def family(name, metric_type, help_text, index):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            for endpoint, item in stats.items():
+                lines.append('{}{{endpoint="{}"}} {}'.format(name, _escape(endpoint), item[index]))
+
+        family('http_requests_total', 'counter', 'Total HTTP requests.', COUNT)
+        family('http_request_errors_total', 'counter', 'Total HTTP requests that failed.', ERRORS)
+        family('http_response_size_bytes_total', 'counter', 'Total HTTP response body bytes.', SIZE)
+
+        name = 'http_request_duration_seconds'
+        lines.append('# HELP {} HTTP request latency.'.format(name))
+        lines.append('# TYPE {} histogram'.format(name))
+        for endpoint, item in stats.items():
+            label = _escape(endpoint)
+            cumulative = 0
+            for bound, count in zip(self.buckets, item[BUCKETS]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{{endpoint="{}",le="{}"}} {}'.format(name, label, le, cumulative))
+            lines.append('{}_sum{{endpoint="{}"}} {}'.format(name, label, item[DURATION]))
+            lines.append('{}_count{{endpoint="{}"}} {}'.format(name, label, item[COUNT]))
+
+        name = 'http_request_duration_quantile_seconds'
+        lines.append('# HELP {} HTTP request latency quantiles estimated from the histogram.'.format(name))
+        lines.append('# TYPE {} gauge'.format(name))
+        for endpoint in stats:
+            for q in QUANTILES:
+                lines.append('{}{{endpoint="{}",quantile="{}"}} {}'.format(
+                    name, _escape(endpoint), q, self.quantile(endpoint, q)))
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_metrics = RequestMetrics()
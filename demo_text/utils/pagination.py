@@ -0,0 +1,124 @@
+'''
+历史数据的游标（keyset）分页
+
+按 (排序字段, id) 定位下一页的起点，翻页深度不影响查询速度，
+游标是对 (排序字段名, 方向, 最后一行的排序值, 最后一行的 id) 的 base64 编码，客户端只需原样传回
+'''
+import base64
+import datetime
+import json
+
+from sqlalchemy import and_, or_
+
+from demo_text.exceptions import APIException
+from demo_text.models.models import Taskdetail, CarEveryday, ConnectDevice
+from demo_text.utils.response import StatusCode
+
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 各模型允许的排序字段，第一个为默认排序
+SORT_KEYS = {
+    Taskdetail: ('createat', 'begintime'),
+    CarEveryday: ('datatime',),
+    ConnectDevice: ('create_at', 'begin_time'),
+}
+
+
+def invalid_cursor():
+    return APIException(msg='无效的分页游标', error_code=StatusCode.PARAMERR[0], status_code=200)
+
+
+def encode_cursor(sort, order, value, id):
+    '''
+    :param sort: 排序字段名
+    :param order: asc 或 desc
+    :param value: 最后一行的排序值
+    :param id: 最后一行的 id
+    '''
+    if isinstance(value, datetime.datetime):
+        value = ['d', value.strftime(DATETIME_FORMAT)]
+    payload = json.dumps([sort, order, value, id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    '''返回 (sort, order, value, id)，格式错误时抛出 APIException'''
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort, order, value, id = json.loads(payload.decode('utf-8'))
+        if isinstance(value, list):
+            value = datetime.datetime.strptime(value[1], DATETIME_FORMAT)
+        return sort, order, value, int(id)
+    except (ValueError, TypeError, IndexError):
+        raise invalid_cursor()
+
+
+class KeysetPage(object):
+    '''一页数据，next_cursor 为 None 表示没有下一页'''
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_more(self):
+        return self.next_cursor is not None
+
+    def to_dict(self, serializer=None):
+        '''
+        :param serializer: 单行转字典的函数，默认调用 to_dict
+        '''
+        serializer = serializer or (lambda row: row.to_dict())
+        return {
+            'items': [serializer(item) for item in self.items],
+            'next_cursor': self.next_cursor,
+            'has_more': self.has_more,
+        }
+
+
+def keyset_paginate(model, query=None, sort=None, order='desc', cursor=None, limit=20):
+    '''
+    游标分页
+    usage:
+        page = keyset_paginate(Taskdetail, Taskdetail.query.filter(Taskdetail.carid == 1),
+                               sort='createat', cursor=request.args.get('cursor'))
+        return Response.success(page.to_dict())
+
+    :param model: Taskdetail、CarEveryday、ConnectDevice
+    :param query: 已加过滤条件的查询，默认 model.query
+    :param sort: 排序字段名，见 SORT_KEYS
+    :param order: asc 或 desc
+    :param cursor: 上一页返回的 next_cursor，None 表示第一页
+    :param limit: 每页行数
+    '''
+    sort_keys = SORT_KEYS[model]
+    sort = sort or sort_keys[0]
+    if sort not in sort_keys or order not in ('asc', 'desc'):
+        raise APIException(msg=StatusCode.PARAMERR[1], error_code=StatusCode.PARAMERR[0], status_code=200)
+
+    column = getattr(model, sort)
+    query = model.query if query is None else query
+
+    if cursor:
+        cursor_sort, cursor_order, value, last_id = decode_cursor(cursor)
+        if (cursor_sort, cursor_order) != (sort, order):
+            raise invalid_cursor()
+        # (column, id) 严格在上一页最后一行之后，展开成 OR 以便 MySQL 使用索引
+        if order == 'desc':
+            query = query.filter(or_(column < value, and_(column == value, model.id < last_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, model.id > last_id)))
+
+    if order == 'desc':
+        query = query.order_by(column.desc(), model.id.desc())
+    else:
+        query = query.order_by(column.asc(), model.id.asc())
+
+    # 多取一行判断是否还有下一页
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, order, getattr(last, sort), last.id)
+    return KeysetPage(rows, next_cursor)
@@ -0,0 +1,169 @@
+
+import contextlib
+import heapq
+import threading
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from log import Log
+from settings import Config
+
+_local = threading.local()
+
+
+class QueryStats(object):
+    '''
+    一次请求（或一段代码）内执行的 sql 统计: 语句数、总耗时、最慢的若干条语句
+    '''
+    __slots__ = ('count', 'total', 'slowest', 'top')
+
+    def __init__(self, top=5):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = []
+        self.top = top
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total += elapsed
+        # 小顶堆只保留最慢的 top 条
+        item = (elapsed, self.count, statement)
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, item)
+        elif elapsed > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, item)
+
+    def slowest_statements(self):
+        '''按耗时降序返回 [(耗时, 语句), ...]'''
+        return [(elapsed, statement) for elapsed, _, statement in sorted(self.slowest, reverse=True)]
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': round(self.total, 6),
+            'slowest': [{'time': round(elapsed, 6), 'statement': statement}
+                        for elapsed, statement in self.slowest_statements()],
+        }
+
+
+def _collectors():
+    '''当前需要记录 sql 的统计对象: 请求上的 g.query_stats 以及 assert_max_queries 打开的统计'''
+    collectors = list(getattr(_local, 'stack', ()))
+    if has_app_context():
+        stats = g.get('query_stats')
+        if stats is not None:
+            collectors.append(stats)
+    return collectors
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    for stats in _collectors():
+        stats.record(statement, elapsed)
+
+
+class QueryInstrumentation(object):
+    '''
+    sql 统计
+    监听所有 Engine 的执行事件（db 与 DBManager 的 engine 都会被记录），
+    每个请求的统计保存在 g.query_stats 中，超过阈值的请求写入 system 日志:
+        SLOW_REQUEST_QUERIES    单个请求 sql 条数阈值
+        SLOW_REQUEST_DB_TIME    单个请求 sql 总耗时阈值（秒）
+        SLOW_QUERY_TOP          日志中记录最慢的语句条数
+    '''
+    _installed = False
+
+    def __init__(self, app=None):
+        self.max_queries = 50
+        self.max_db_time = 0.5
+        self.top = 5
+        if app is not None:
+            self.init_app(app)
+
+    @classmethod
+    def install(cls):
+        '''注册 Engine 事件，只注册一次'''
+        if cls._installed:
+            return
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        cls._installed = True
+
+    def init_app(self, app):
+        self.max_queries = app.config.get('SLOW_REQUEST_QUERIES', getattr(Config, 'SLOW_REQUEST_QUERIES', 50))
+        self.max_db_time = app.config.get('SLOW_REQUEST_DB_TIME', getattr(Config, 'SLOW_REQUEST_DB_TIME', 0.5))
+        self.top = app.config.get('SLOW_QUERY_TOP', getattr(Config, 'SLOW_QUERY_TOP', 5))
+        self.install()
+
+        @app.before_request
+        def start_query_stats():
+            g.query_stats = QueryStats(top=self.top)
+
+        @app.teardown_request
+        def finish_query_stats(exc=None):
+            stats = g.pop('query_stats', None)
+            if stats is not None:
+                self.check(stats)
+
+    def is_slow(self, stats):
+        if self.max_queries and stats.count > self.max_queries:
+            return True
+        return bool(self.max_db_time) and stats.total > self.max_db_time
+
+    def check(self, stats):
+        '''超过阈值时记录日志'''
+        if not self.is_slow(stats):
+            return False
+        params = stats.to_dict()
+        params['url'] = request.path
+        params['endpoint'] = request.endpoint
+        params['request_id'] = g.get('request_id')
+        Log.system(['WARN', 'slow request: {} queries, {:.3f}s'.format(stats.count, stats.total), params])
+        return True
+
+
+@contextlib.contextmanager
+def count_queries(top=5):
+    '''
+    统计代码块内执行的 sql
+    usage:
+        with count_queries() as stats:
+            User.query.get(1)
+        print(stats.count, stats.total)
+    '''
+    QueryInstrumentation.install()
+    stats = QueryStats(top=top)
+    stack = _local.__dict__.setdefault('stack', [])
+    stack.append(stats)
+    try:
+        yield stats
+    finally:
+        stack.remove(stats)
+
+
+@contextlib.contextmanager
+def assert_max_queries(n):
+    '''
+    测试用，代码块内执行的 sql 超过 n 条时抛出 AssertionError
+    usage:
+        with assert_max_queries(2):
+            form.validate()
+    '''
+    with count_queries(top=n + 1) as stats:
+        yield stats
+    if stats.count > n:
+        statements = '\n'.join(statement for _, statement in stats.slowest_statements())
+        raise AssertionError('expected at most {} queries, got {}:\n{}'.format(n, stats.count, statements))
+
+
+query_instrumentation = QueryInstrumentation()
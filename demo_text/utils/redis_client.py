@@ -0,0 +1,97 @@
+
+import contextlib
+
+from redis import BlockingConnectionPool, StrictRedis
+
+from settings import Config
+
+# LRANGE + LTRIM 在脚本中原子执行，两条命令之间不会插入其他客户端的写入
+_POP_MANY_SCRIPT = '''
+local count = tonumber(ARGV[1])
+local items = redis.call('lrange', KEYS[1], -count, -1)
+redis.call('ltrim', KEYS[1], 0, -count - 1)
+return items
+'''
+
+
+def create_redis_store(config=Config, decode_responses=True):
+    '''
+    创建 redis 客户端
+    REDIS_CLUSTER_FLAG 为 True 时使用集群模式（依赖 redis-py-cluster），
+    否则使用有界的 BlockingConnectionPool，连接用尽时等待 REDIS_POOL_TIMEOUT 秒
+    '''
+    options = dict(config.REDIS_POOL_OPTIONS)
+    if getattr(config, 'REDIS_CLUSTER_FLAG', False):
+        try:
+            from rediscluster import RedisCluster
+        except ImportError:
+            raise RuntimeError('REDIS_CLUSTER_FLAG is set but redis-py-cluster is not installed, '
+                               'pip install redis-py-cluster (see requirements.txt)')
+        nodes = getattr(config, 'REDIS_CLUSTER_NODES', None) or [
+            {'host': config.REDIS_HOST, 'port': config.REDIS_PORT}]
+        options.pop('db', None)
+        options.pop('host', None)
+        options.pop('port', None)
+        options.pop('timeout', None)
+        return RedisCluster(startup_nodes=nodes, decode_responses=decode_responses,
+                            skip_full_coverage_check=True, **options)
+
+    pool = BlockingConnectionPool(decode_responses=decode_responses, **options)
+    return StrictRedis(connection_pool=pool)
+
+
+@contextlib.contextmanager
+def pipeline(client, transaction=False):
+    '''
+    批量执行 redis 命令，退出时一次性发送
+    usage:
+        with pipeline(redis_store) as pipe:
+            pipe.set('a', 1)
+            pipe.hset('car_1', 'status', 1)
+    '''
+    pipe = client.pipeline(transaction=transaction)
+    try:
+        yield pipe
+        pipe.execute()
+    finally:
+        pipe.reset()
+
+
+def set_many(client, mapping, ex=None):
+    '''
+    一次往返写入多个 key
+
+    :param client: redis 客户端
+    :param mapping: {key: value}
+    :param ex: 过期时间（秒）
+    '''
+    with pipeline(client) as pipe:
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=ex)
+
+
+def hset_many(client, mapping):
+    '''
+    一次往返写入多个 hash 的多个字段，用于批量更新状态
+
+    :param client: redis 客户端
+    :param mapping: {key: {field: value}}
+    '''
+    with pipeline(client) as pipe:
+        for key, fields in mapping.items():
+            for field, value in fields.items():
+                pipe.hset(key, field, value)
+
+
+def pop_many(client, key, count):
+    '''
+    原子地从列表右端取出最多 count 个元素，按取出顺序返回（LPUSH 写入、BRPOP 消费的队列即按入队顺序）
+    不依赖 Redis 6.2 的 RPOP key count，单个 key 的脚本在集群模式下同样可用
+
+    :param client: redis 客户端
+    :param key: 列表 key
+    :param count: 最多取出的个数
+    '''
+    if count <= 0:
+        return []
+    return list(reversed(client.eval(_POP_MANY_SCRIPT, 1, key, count)))
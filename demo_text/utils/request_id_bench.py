@@ -0,0 +1,13 @@
+'''
+请求id生成耗时对比，见 demo_text.utils.request_id.benchmark
+request_id 在导入 demo_text 时已被加载，不能直接 python -m demo_text.utils.request_id 运行
+
+usage:
+    python -m demo_text.utils.request_id_bench [number]
+'''
+import sys
+
+from demo_text.utils.request_id import benchmark
+
+if __name__ == '__main__':
+    benchmark(number=int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -1,4 +1,6 @@
-from flask import jsonify
+from flask import current_app, stream_with_context
+
+from .encoder import default_encoder
 
 
 class StatusCode():
@@ -41,6 +43,42 @@ RetMsgMap = {
 
 
 class Response():
+    # 响应 json 编码器，需实现 dumps(obj) -> bytes，可通过 set_encoder 替换
+    encoder = default_encoder()
+    # 固定内容的响应体只编码一次
+    _constant_bodies = {}
+
+    @classmethod
+    def set_encoder(cls, encoder):
+        '''
+        replace the json encoder of responses
+
+        :param encoder: object with dumps(obj) returning bytes
+        '''
+        cls.encoder = encoder
+        cls._constant_bodies = {}
+
+    @classmethod
+    def json(cls, res):
+        '''
+        json response encoded by the current encoder
+
+        :param res: dict response to exact request
+        '''
+        return current_app.response_class(cls.encoder.dumps(res), mimetype='application/json')
+
+    @classmethod
+    def constant(cls, code):
+        '''
+        json response of a fixed status code, the body is encoded once
+
+        :param code: status code tuple
+        '''
+        body = cls._constant_bodies.get(code)
+        if body is None:
+            body = cls._constant_bodies[code] = cls.encoder.dumps({'code': code[0], 'msg': code[1]})
+        return current_app.response_class(body, mimetype='application/json')
+
     @classmethod
     def success(cls, data=None, msg=None):
         '''
@@ -59,7 +97,7 @@ class Response():
         if data is not None:
             res['data'] = data
 
-        return jsonify(res)
+        return cls.json(res)
 
     @classmethod
     def error(cls, code=StatusCode.SERVERERR, msg=None, data=None):
@@ -82,7 +120,7 @@ class Response():
         if data is not None:
             res['data'] = data
 
-        return jsonify(res)
+        return cls.json(res)
 
     @classmethod
     def not_found(cls):
@@ -91,12 +129,7 @@ class Response():
 
         :param data: data response to exact request
         '''
-        res = {
-            'code': StatusCode.NODATA[0],
-            'msg': StatusCode.NODATA[1]
-        }
-
-        return jsonify(res)
+        return cls.constant(StatusCode.NODATA)
 
     @classmethod
     def server_error(cls):
@@ -105,9 +138,47 @@ class Response():
 
         :param data: data response to exact request
         '''
-        res = {
-            'code': StatusCode.SERVERERR[0],
-            'msg': StatusCode.SERVERERR[1]
-        }
+        return cls.constant(StatusCode.SERVERERR)
+
+    @classmethod
+    def binary(cls, data, mimetype='application/octet-stream'):
+        '''
+        binary response, the body is sent as it is without json encoding
+
+        :param data: bytes response to exact request
+        :param mimetype: content type of the body
+        '''
+        return current_app.response_class(data, mimetype=mimetype)
+
+    @classmethod
+    def stream(cls, iterable, msg=None, chunk_size=100):
+        '''
+        streaming success response, the body is the same as success(list(iterable))
+        but the items are encoded and sent in chunks while iterating,
+        so the whole list never has to be held in memory
 
-        return jsonify(res)
+        :param iterable: items (dict) of data, usually from a yield_per query
+        :param msg: message of the response
+        :param chunk_size: number of items encoded into one chunk
+        '''
+        head = cls.encoder.dumps({
+            'code': StatusCode.OK[0],
+            'msg': StatusCode.OK[1] if msg is None else msg
+        })
+        encoder = cls.encoder
+
+        def generate():
+            yield head[:-1] + b',"data":['
+            chunk = []
+            first = True
+            for item in iterable:
+                chunk.append(encoder.dumps(item))
+                if len(chunk) >= chunk_size:
+                    yield (b'' if first else b',') + b','.join(chunk)
+                    chunk = []
+                    first = False
+            if chunk:
+                yield (b'' if first else b',') + b','.join(chunk)
+            yield b']}'
+
+        return current_app.response_class(stream_with_context(generate()), mimetype='application/json')
@@ -0,0 +1,105 @@
+'''
+车辆每日工作时长汇总
+
+读取上次水位之后完成的任务（taskdetail.taskstu = 5），按 (车辆, 任务开始日期) 从 taskdetail 重新计算当日总时长，
+用 INSERT ... ON DUPLICATE KEY UPDATE 批量写入 car_everyday，再用一条 UPDATE ... JOIN 从 car_everyday 汇总更新 car 的总时长。
+每次写入的都是重新计算的绝对值，重复执行结果不变；水位只在事务提交后前移，中途失败时下次从原水位继续。
+taskdetail 中没有里程数据，car_everyday.mileage 只在新建时写 0，已有的值保持不变，car.carmileage 不在这里更新。
+car_everyday.datatime 由 day_timestamp 在应用端按本地时区计算，与历史接口的日期过滤一致，不依赖 MySQL 会话时区
+'''
+import datetime
+
+from sqlalchemy import text
+
+from demo_text import db, redis_store
+from settings import Config
+
+ROLLUP_WATERMARK_KEY = 'rollup:car_everyday:watermark'
+WATERMARK_FORMAT = '%Y-%m-%d %H:%M:%S'
+# TIMESTAMP 列的最小值，没有水位时从头汇总
+MIN_TIMESTAMP = datetime.datetime(1970, 1, 2)
+TASK_FINISHED = 5
+# 每条 INSERT 写入的行数
+UPSERT_BATCH = 1000
+
+# 本次涉及的 (车辆, 日期)
+_CHANGED_DAYS = '''
+    SELECT DISTINCT carid, DATE(begintime) AS day
+    FROM taskdetail
+    WHERE taskstu = :finished AND endtime >= :since AND endtime < :until AND endtime > begintime
+'''
+
+DAILY_ATIME = text('''
+    SELECT t.carid, c.day, SUM(TIMESTAMPDIFF(SECOND, t.begintime, t.endtime)) AS atime
+    FROM ({changed}) AS c
+    JOIN taskdetail AS t
+        ON t.carid = c.carid AND t.begintime >= c.day AND t.begintime < c.day + INTERVAL 1 DAY
+    WHERE t.taskstu = :finished AND t.endtime > t.begintime
+    GROUP BY t.carid, c.day
+'''.format(changed=_CHANGED_DAYS))
+
+UPSERT_CAR_EVERYDAY = text('''
+    INSERT INTO car_everyday (car_id, data, datatime, atime, mileage)
+    VALUES (:car_id, :day, :datatime, :atime, 0)
+    ON DUPLICATE KEY UPDATE data = VALUES(data), atime = VALUES(atime)
+''')
+
+UPDATE_CAR_TOTALS = text('''
+    UPDATE car
+    JOIN (
+        SELECT e.car_id, SUM(e.atime) AS atime
+        FROM car_everyday AS e
+        JOIN (SELECT DISTINCT carid FROM ({changed}) AS d) AS c ON c.carid = e.car_id
+        GROUP BY e.car_id
+    ) AS s ON s.car_id = car.id
+    SET car.caratime = s.atime
+'''.format(changed=_CHANGED_DAYS))
+
+
+def day_timestamp(day):
+    '''
+    日期当天 0 点（本地时区）的时间戳，即 car_everyday.datatime
+
+    :param day: date 或 datetime，datetime 只取日期部分
+    '''
+    return int(datetime.datetime(day.year, day.month, day.day).timestamp())
+
+
+def get_watermark():
+    value = redis_store.get(ROLLUP_WATERMARK_KEY)
+    if not value:
+        return None
+    return datetime.datetime.strptime(value, WATERMARK_FORMAT)
+
+
+def set_watermark(value):
+    redis_store.set(ROLLUP_WATERMARK_KEY, value.strftime(WATERMARK_FORMAT))
+
+
+def rollup_car_everyday(until=None, overlap=None, session=None):
+    '''
+    汇总 [水位 - overlap, until) 内完成的任务，返回 (since, until, car_everyday 写入行数, car 影响行数)
+
+    :param until: 截止时间，默认当前时间
+    :param overlap: 回看时长（秒），覆盖提交较晚的任务，默认 ROLLUP_OVERLAP
+    :param session: 默认 db.session
+    '''
+    session = session or db.session
+    until = until or datetime.datetime.now().replace(microsecond=0)
+    overlap = getattr(Config, 'ROLLUP_OVERLAP', 3600) if overlap is None else overlap
+    watermark = get_watermark()
+    since = max(watermark - datetime.timedelta(seconds=overlap), MIN_TIMESTAMP) if watermark else MIN_TIMESTAMP
+
+    params = {'since': since, 'until': until, 'finished': TASK_FINISHED}
+    try:
+        rows = [{'car_id': carid, 'day': day, 'datatime': day_timestamp(day), 'atime': int(atime)}
+                for carid, day, atime in session.execute(DAILY_ATIME, params)]
+        for start in range(0, len(rows), UPSERT_BATCH):
+            session.execute(UPSERT_CAR_EVERYDAY, rows[start:start + UPSERT_BATCH])
+        cars = session.execute(UPDATE_CAR_TOTALS, params).rowcount
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    set_watermark(until)
+    return since, until, len(rows), cars
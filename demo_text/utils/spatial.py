@@ -0,0 +1,139 @@
+
+import math
+import time
+from threading import Lock
+
+import numpy as np
+
+from demo_text import db
+from demo_text.models.models import Operation
+from demo_text.utils.geometry import parse_latlgs
+from settings import Config
+
+
+def point_in_polygon(lng, lat, lngs, lats):
+    '''
+    射线法判断点是否在多边形内
+
+    :param lng: 经度
+    :param lat: 纬度
+    :param lngs: 多边形顶点经度数组
+    :param lats: 多边形顶点纬度数组
+    '''
+    lngs1 = np.roll(lngs, 1)
+    lats1 = np.roll(lats, 1)
+    crossing = (lats > lat) != (lats1 > lat)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (lngs1 - lngs) * (lat - lats) / (lats1 - lats) + lngs
+    return bool(np.count_nonzero(crossing & (lng < x)) % 2)
+
+
+class OperationIndex(object):
+    '''
+    作业区域空间索引
+    按外包矩形把作业区域放入固定大小的网格，查询时只对所在网格内的区域做精确判断。
+    首次查询时从 operation 表构建，之后按 refresh_interval 检查 createat/updateat，
+    只重新解析有变化的区域
+    '''
+
+    def __init__(self, cell_size=None, refresh_interval=None, max_cells=1024):
+        self.cell_size = cell_size or getattr(Config, 'OPERATION_INDEX_CELL_SIZE', 0.01)
+        self.refresh_interval = refresh_interval if refresh_interval is not None else \
+            getattr(Config, 'OPERATION_INDEX_REFRESH_INTERVAL', 5)
+        # 覆盖网格数超过 max_cells 的大区域不放入网格，每次查询都检查
+        self.max_cells = max_cells
+        # (polygons, grid, large)，整体替换，查询时只读取一次，不会看到新旧混合的状态
+        # polygons: id -> (version, bbox, lngs, lats)，坐标为空的区域 bbox 为 None，记录版本避免重复读取
+        self._state = ({}, {}, ())
+        self._checked_at = None
+        self._lock = Lock()
+
+    def locate(self, lng, lat):
+        '''
+        查询点所在的作业区域id列表
+
+        :param lng: 经度
+        :param lat: 纬度
+        '''
+        self._maybe_refresh()
+        polygons, grid, large = self._state
+        result = []
+        for ids in (grid.get(self._cell(lng, lat), ()), large):
+            for operation_id in ids:
+                _, bbox, lngs, lats = polygons[operation_id]
+                if bbox[0] <= lng <= bbox[2] and bbox[1] <= lat <= bbox[3] and \
+                        point_in_polygon(lng, lat, lngs, lats):
+                    result.append(operation_id)
+        return result
+
+    def refresh(self):
+        '''检查 operation 表变化并增量更新索引'''
+        with self._lock:
+            self._refresh()
+
+    def clear(self):
+        with self._lock:
+            self._state = ({}, {}, ())
+            self._checked_at = None
+
+    def _maybe_refresh(self):
+        if not self._expired():
+            return
+        with self._lock:
+            # 等锁期间其他线程可能已经刷新过
+            if self._expired():
+                self._refresh()
+
+    def _expired(self):
+        checked_at = self._checked_at
+        return checked_at is None or time.monotonic() - checked_at >= self.refresh_interval
+
+    def _refresh(self):
+        rows = db.session.query(Operation.id, Operation.createat, Operation.updateat).filter(
+            Operation.operationdel == 1).all()
+        versions = {row.id: (row.createat, row.updateat) for row in rows}
+        polygons = dict(self._state[0])
+        changed = [operation_id for operation_id, version in versions.items()
+                   if operation_id not in polygons or polygons[operation_id][0] != version]
+        removed = [operation_id for operation_id in polygons if operation_id not in versions]
+
+        if changed:
+            for row in db.session.query(Operation.id, Operation.latlgs).filter(
+                    Operation.id.in_(changed)):
+                points = parse_latlgs(row.latlgs)
+                if not len(points):
+                    polygons[row.id] = (versions[row.id], None, None, None)
+                    continue
+                lngs = np.ascontiguousarray(points[:, 0])
+                lats = np.ascontiguousarray(points[:, 1])
+                bbox = (lngs.min(), lats.min(), lngs.max(), lats.max())
+                polygons[row.id] = (versions[row.id], bbox, lngs, lats)
+        for operation_id in removed:
+            polygons.pop(operation_id, None)
+
+        if changed or removed or self._checked_at is None:
+            grid, large = self._build_grid(polygons)
+            self._state = (polygons, grid, large)
+        self._checked_at = time.monotonic()
+
+    def _cell(self, lng, lat):
+        return int(math.floor(lng / self.cell_size)), int(math.floor(lat / self.cell_size))
+
+    def _build_grid(self, polygons):
+        grid = {}
+        large = []
+        for operation_id, (_, bbox, _, _) in polygons.items():
+            if bbox is None:
+                continue
+            min_x, min_y = self._cell(bbox[0], bbox[1])
+            max_x, max_y = self._cell(bbox[2], bbox[3])
+            if (max_x - min_x + 1) * (max_y - min_y + 1) > self.max_cells:
+                large.append(operation_id)
+                continue
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    grid.setdefault((x, y), []).append(operation_id)
+        return {cell: tuple(ids) for cell, ids in grid.items()}, tuple(large)
+
+
+operation_index = OperationIndex()
@@ -0,0 +1,194 @@
+
+import json
+from threading import Lock
+
+from demo_text import db, redis_store
+from demo_text.models.models import Car, PlatformInfo, Taskbase
+
+STATE_DELTA_EVENT = 'state_delta'
+PLATFORM_ROOM = 'platforms'
+# 最新快照保存在 redis 中，多 worker 部署时任一 worker 都能返回同一版本的快照
+STATE_SNAPSHOT_KEY = 'state_snapshot'
+
+
+def car_room(car_id):
+    return 'car_{}'.format(car_id)
+
+
+def operation_room(operation_id):
+    return 'operation_{}'.format(operation_id)
+
+
+class StatePublisher(object):
+    '''
+    车辆、台架状态差量推送
+    内存中保存最近一次的状态快照，刷新时只把变化的字段推送到订阅的房间:
+        car_{id}        单台车辆
+        operation_{id}  作业区域内执行任务的车辆
+        platforms       全部台架
+    每次有变化 version 加 1，客户端断线后通过快照接口按 version 重新同步。
+    多 worker 部署时只由 leader 调用 refresh，快照和版本号保存在 redis 中
+    '''
+    CAR_FIELDS = ('carstu', 'is_conn', 'is_conn_server', 'isonlineat')
+    PLATFORM_FIELDS = ('platform_status', 'is_conn')
+
+    def __init__(self):
+        self.version = 0
+        self.cars = {}
+        self.platforms = {}
+        self.car_operations = {}
+        self.socketio = None
+        self.namespace = '/info'
+        self._loaded = False
+        self._lock = Lock()
+
+    def init_socketio(self, socketio, namespace='/info'):
+        self.socketio = socketio
+        self.namespace = namespace
+
+    def reset(self):
+        '''清空内存快照，下次 refresh 时重新加载并从 redis 中的版本号继续'''
+        with self._lock:
+            self.cars = {}
+            self.platforms = {}
+            self.car_operations = {}
+            self._loaded = False
+
+    def load(self):
+        '''从数据库读取当前状态'''
+        cars = {}
+        for row in db.session.query(Car.id, Car.carstu, Car.is_conn, Car.is_conn_server,
+                                    Car.isonlineat).filter(Car.cardel == 1):
+            cars[row.id] = {
+                'carstu': row.carstu,
+                'is_conn': row.is_conn,
+                'is_conn_server': row.is_conn_server,
+                'isonlineat': row.isonlineat.strftime('%Y-%m-%d %H:%M:%S') if row.isonlineat else None,
+            }
+
+        platforms = {}
+        for row in db.session.query(PlatformInfo.id, PlatformInfo.platform_status,
+                                    PlatformInfo.is_conn).filter(PlatformInfo.platdel == 1):
+            platforms[row.id] = {'platform_status': row.platform_status, 'is_conn': row.is_conn}
+
+        # 执行中的任务决定车辆所在的作业区域
+        car_operations = {}
+        for row in db.session.query(Taskbase.carid, Taskbase.operationid).filter(
+                Taskbase.taskstu == 1, Taskbase.isdel == 0, Taskbase.carid != 0):
+            car_operations.setdefault(row.carid, set()).add(row.operationid)
+
+        return cars, platforms, car_operations
+
+    def refresh(self, emit=True):
+        '''
+        重新读取状态并推送变化，返回 (version, 变化的车辆, 变化的台架)
+        '''
+        with self._lock:
+            cars, platforms, car_operations = self.load()
+            car_deltas = self._diff(self.cars, cars, self.CAR_FIELDS)
+            platform_deltas = self._diff(self.platforms, platforms, self.PLATFORM_FIELDS)
+            self.cars, self.platforms, self.car_operations = cars, platforms, car_operations
+            first_load = not self._loaded
+            if first_load:
+                # 接管 leader 后从上一个 leader 的版本号继续
+                self.version = self._stored_version()
+            if first_load or car_deltas or platform_deltas:
+                self.version += 1
+                self._store()
+            self._loaded = True
+            version = self.version
+
+        if emit and not first_load and self.socketio is not None:
+            self._emit(version, car_deltas, platform_deltas, car_operations)
+        return version, car_deltas, platform_deltas
+
+    def snapshot(self, car_id=None, operation_id=None):
+        '''
+        带版本号的状态快照，可按车辆或作业区域过滤
+
+        :param car_id: 车辆id
+        :param operation_id: 作业区域id
+        '''
+        stored = self._load_stored()
+        if stored is None:
+            with self._lock:
+                loaded = self._loaded
+                if loaded:
+                    stored = self._serialize(self.version, self.cars, self.platforms, self.car_operations)
+            if not loaded:
+                # leader 还没有写入快照时直接读数据库，版本号为 0，共享快照只由 leader 的 refresh 写入
+                cars, platforms, car_operations = self.load()
+                stored = self._serialize(0, cars, platforms, car_operations)
+
+        cars = stored['cars']
+        if car_id is not None:
+            cars = {str(car_id): cars[str(car_id)]} if str(car_id) in cars else {}
+        elif operation_id is not None:
+            car_operations = stored.get('car_operations', {})
+            cars = {cid: state for cid, state in cars.items()
+                    if operation_id in car_operations.get(cid, ())}
+        return {
+            'version': stored['version'],
+            'cars': cars,
+            'platforms': stored['platforms'],
+        }
+
+    @staticmethod
+    def _serialize(version, cars, platforms, car_operations):
+        return {
+            'version': version,
+            'cars': {str(cid): state for cid, state in cars.items()},
+            'platforms': {str(pid): state for pid, state in platforms.items()},
+            'car_operations': {str(cid): list(ops) for cid, ops in car_operations.items()},
+        }
+
+    def _store(self):
+        redis_store.set(STATE_SNAPSHOT_KEY, json.dumps(
+            self._serialize(self.version, self.cars, self.platforms, self.car_operations)))
+
+    def _load_stored(self):
+        try:
+            data = redis_store.get(STATE_SNAPSHOT_KEY)
+            return json.loads(data) if data else None
+        except Exception:
+            return None
+
+    def _stored_version(self):
+        stored = self._load_stored()
+        return stored['version'] if stored else 0
+
+    @staticmethod
+    def _diff(old, new, fields):
+        '''返回 {id: 变化的字段}，删除的记录值为 None'''
+        deltas = {}
+        for key, state in new.items():
+            previous = old.get(key)
+            if previous is None:
+                deltas[key] = dict(state)
+                continue
+            changed = {field: state[field] for field in fields if previous[field] != state[field]}
+            if changed:
+                deltas[key] = changed
+        for key in old:
+            if key not in new:
+                deltas[key] = None
+        return deltas
+
+    def _emit(self, version, car_deltas, platform_deltas, car_operations):
+        payloads = {}
+        for car_id, delta in car_deltas.items():
+            rooms = [car_room(car_id)] + [operation_room(op) for op in car_operations.get(car_id, ())]
+            for room in rooms:
+                payloads.setdefault(room, {'version': version, 'cars': {}, 'platforms': {}})['cars'][
+                    str(car_id)] = delta
+        if platform_deltas:
+            payloads[PLATFORM_ROOM] = {
+                'version': version,
+                'cars': {},
+                'platforms': {str(pid): delta for pid, delta in platform_deltas.items()},
+            }
+        for room, payload in payloads.items():
+            self.socketio.emit(STATE_DELTA_EVENT, payload, room=room, namespace=self.namespace)
+
+
+state_publisher = StatePublisher()
@@ -1,17 +1,42 @@
+import atexit
 import codecs
 import datetime
 import json
 import logging
 import os
 import re
+import sys
+import threading
 import time
 from logging.handlers import BaseRotatingHandler
 
 from flask import g
 from loguru import logger
 
-from demo_text.utils.getip import get_client_ip, ip2long, get_local_ip
 from settings import Config
+from .sink import AsyncSink
+
+# 异步批量写出的日志标记
+ASYNC_FLAG = '_async_batch'
+
+# 结构化日志（JSON lines）各类日志的字段
+LOG_FIELDS = {
+    'system': ('level', 'content', 'params', 'ip', 'timestamp'),
+    'operate': ('user_id', 'username', 'bussiness', 'action', 'content', 'status', 'ip'),
+    'device': ('user_id', 'username', 'device_key', 'device_name', 'product_key', 'product_name',
+               'type', 'event', 'content', 'status', 'ip'),
+}
+
+
+def structured_format(record):
+    '''
+    JSON lines 格式: {"time": 时间戳, "family": 日志类型, 各类日志字段...}
+    '''
+    fields = record['extra'].get('fields') or {}
+    data = {'time': record['time'].timestamp(), 'family': fields.get('family')}
+    data.update(fields)
+    record['extra']['_json'] = json.dumps(data, ensure_ascii=False, default=str)
+    return '{extra[_json]}\n'
 
 
 class LoggerManager():
@@ -22,18 +47,89 @@ class LoggerManager():
     def __init__(self):
         self.base_path = Config.LOG_BASE_PATH
         self.config = Config.LOG_MANAGER_CONFIG
+        self.async_sinks = []
         self.init()
 
     def init(self):
         '''initialize the logger information'''
+        self.replace_default_handler()
         for handler in self.config['LOG_HANDLERS']:
+            path = '{}/{}'.format(self.base_path, handler['file'])
+            if handler.get('async'):
+                self.add_async_handler(path, handler)
+                continue
+
             def filter_handler(record, filter_flag=handler['filter']):
-                return filter_flag in record['extra']
+                return filter_flag in record['extra'] and ASYNC_FLAG not in record['extra']
 
-            logger.add('{}/{}'.format(self.base_path, handler['file']), filter=filter_handler, **handler['options'])
+            options = dict(handler['options'])
+            options['format'] = self.get_format(handler)
+            logger.add(path, filter=filter_handler, **options)
+
+    @staticmethod
+    def replace_default_handler():
+        '''
+        异步 handler 写出的批量日志只应进入对应的文件 handler，
+        loguru 默认的 stderr handler（id 0）没有过滤，会把已经输出过的日志再输出一次，替换为过滤掉批量日志的 stderr handler
+        '''
+        try:
+            logger.remove(0)
+        except ValueError:
+            return
+        logger.add(sys.stderr, filter=lambda record: ASYNC_FLAG not in record['extra'])
+
+    @staticmethod
+    def get_format(handler):
+        '''handler 配置 structured: true 时输出 JSON lines'''
+        if handler.get('structured'):
+            return structured_format
+        return handler['options'].get('format', '{time:X}|{message}')
+
+    def add_async_handler(self, path, handler):
+        '''
+        异步写文件的日志处理
+        前端 handler 负责格式化并放入 AsyncSink 缓冲区，后台线程把一批日志作为一条
+        raw 日志交给文件 handler 写出，文件的轮转、保留策略仍由 loguru 处理
+        '''
+        filter_flag = handler['filter']
+        options = dict(handler['options'])
+        log_format = self.get_format(handler)
+
+        def front_filter(record):
+            return filter_flag in record['extra'] and ASYNC_FLAG not in record['extra']
+
+        def file_filter(record):
+            return filter_flag in record['extra'] and ASYNC_FLAG in record['extra']
+
+        batch_logger = logger.bind(**{filter_flag: True, ASYNC_FLAG: True}).opt(raw=True)
+
+        def write_batch(batch):
+            batch_logger.info(''.join(batch))
+
+        sink = AsyncSink(write_batch, name='{}-sink'.format(handler['name']), **handler['async'])
+        logger.add(path, filter=file_filter, **options)
+        logger.add(sink, filter=front_filter, format=log_format)
+        self.async_sinks.append(sink)
+
+    def flush(self, timeout=None):
+        '''等待异步日志全部写出'''
+        for sink in self.async_sinks:
+            sink.flush(timeout)
+
+    def stop(self):
+        '''停止异步日志线程，写出剩余日志'''
+        for sink in self.async_sinks:
+            sink.stop()
 
 
 class Log():
+    @staticmethod
+    def fields(family, message):
+        '''按日志类型的字段表把消息列表转成字典，供结构化日志使用'''
+        fields = dict(zip(LOG_FIELDS[family], message))
+        fields['family'] = family
+        return fields
+
     @staticmethod
     def system(message):
         '''
@@ -49,11 +145,13 @@ class Log():
             raise Exception(
                 'log format error, message should be list and not empty')
 
+        fields = Log.fields('system', message)
         if isinstance(message[2], dict) or isinstance(message[2], list):
             message[2] = json.dumps(message[2])
-        message.append(str(ip2long(get_local_ip())))
+        message.append(str(get_host_ip_long()))
         message.append(str(int(time.time() * 1000 * 1000)))
-        logger.bind(system=True).info('|'.join(message))
+        fields['ip'], fields['timestamp'] = message[3], message[4]
+        logger.bind(system=True, fields=fields).info('|'.join(message))
 
     @staticmethod
     def operate(message):
@@ -73,10 +171,12 @@ class Log():
             raise Exception(
                 'log format error, message should be list and not empty')
 
+        fields = Log.fields('operate', message)
         if isinstance(message[4], dict) or isinstance(message[4], list):
             message[4] = json.dumps(message[4])
-        message.append(str(ip2long(get_local_ip())))
-        logger.bind(operate=True).info('|'.join(message))
+        message.append(str(get_host_ip_long()))
+        fields['ip'] = message[-1]
+        logger.bind(operate=True, fields=fields).info('|'.join(message))
 
     @staticmethod
     def device(message):
@@ -101,10 +201,12 @@ class Log():
             raise Exception(
                 'log format error, message should be list and not empty')
 
+        fields = Log.fields('device', message)
         if isinstance(message[8], dict) or isinstance(message[8], list):
             message[8] = json.dumps(message[8])
-        message.append(str(ip2long(get_local_ip())))
-        logger.bind(device=True).info('|'.join(message))
+        message.append(str(get_host_ip_long()))
+        fields['ip'] = message[-1]
+        logger.bind(device=True, fields=fields).info('|'.join(message))
 
 
 def record_operate_log(bussiness, action, content, status='成功'):
@@ -126,6 +228,68 @@ def record_operate_log(bussiness, action, content, status='成功'):
         record_system_log(e, params, level='ERROR')
 
 
+class ErrorAggregator(object):
+    '''
+    相同位置的异常限流
+    同一签名 (filename, lineno, 异常类型) 在 window 秒内只记录第一次的完整日志，
+    之后只计数，由后台线程每 window 秒输出一条汇总日志
+    '''
+
+    def __init__(self, window=None):
+        self.window = window if window is not None else getattr(Config, 'ERROR_LOG_WINDOW', 60)
+        # signature -> [窗口开始时间, 被合并的次数]
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def allow(self, signature):
+        '''返回是否需要记录完整日志'''
+        if not self.window:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            item = self._errors.get(signature)
+            if item is None or now - item[0] >= self.window:
+                self._errors[signature] = [now, 0]
+                return True
+            item[1] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='error-aggregator', daemon=True)
+                self._thread.start()
+        return False
+
+    def flush(self):
+        '''输出被合并的异常次数'''
+        now = time.monotonic()
+        with self._lock:
+            suppressed = [(signature, item[1]) for signature, item in self._errors.items() if item[1]]
+            self._errors = {signature: item for signature, item in self._errors.items()
+                            if now - item[0] < self.window}
+            for item in self._errors.values():
+                item[1] = 0
+        for (filename, lineno, error_type), count in suppressed:
+            Log.system(['ERROR', 'suppressed {} occurrences of {}'.format(count, error_type), {
+                'type': 'error_aggregate',
+                'filename': filename,
+                'lineno': lineno,
+                'error_type': error_type,
+                'count': count,
+                'window': self.window,
+            }])
+
+    def _run(self):
+        while True:
+            time.sleep(self.window)
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+
+error_aggregator = ErrorAggregator()
+atexit.register(error_aggregator.flush)
+
+
 def record_system_log(content, params, level='ERROR', request=None):
     try:
         if not params.get('filename', None):
@@ -133,6 +297,10 @@ def record_system_log(content, params, level='ERROR', request=None):
         if not params.get('lineno', None):
             params['lineno'] = content.__traceback__.tb_lineno
         if request:
+            # 请求异常按位置限流，重复的异常不再序列化请求信息
+            signature = (params['filename'], params['lineno'], type(content).__name__)
+            if not error_aggregator.allow(signature):
+                return
             params['url'] = request.url
             params['args'] = request.args.to_dict()
             params['form'] = request.form.to_dict()
@@ -144,29 +312,102 @@ def record_system_log(content, params, level='ERROR', request=None):
 
 
 class MQTTRecvLog(object):
-    def __init__(self):
-        self.recv_log_path_list = ['./logs/mqtt_recv.log', './logs/mqtt_recv1.log']
-        self.recv_log_path = self.recv_log_path_list[0]
+    '''
+    MQTT 接收日志
+    文件句柄常驻，大小在内存中计数，超过 max_bytes 时按 mqtt_recv.log -> mqtt_recv.log.1 -> ... 轮转，
+    写入经过缓冲，每 flush_interval 秒刷新一次（空闲时由后台线程定时刷新），多线程调用安全
+    '''
+
+    def __init__(self, path='./logs/mqtt_recv.log', max_bytes=50 * 1024 * 1024, backup_count=1,
+                 flush_interval=1.0, fsync=False, buffer_size=64 * 1024):
+        '''
+        :param path: 日志文件路径
+        :param max_bytes: 单个文件最大字节数
+        :param backup_count: 保留的历史文件个数
+        :param flush_interval: 刷新间隔（秒），0 表示每条都刷新
+        :param fsync: 刷新时是否同步到磁盘
+        :param buffer_size: 写缓冲大小
+        '''
+        self.recv_log_path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.buffer_size = buffer_size
+        self._stream = None
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        atexit.register(self.close)
 
     def record_log(self, info_type, log_info):
-        if os.path.exists(self.recv_log_path):
-            size = os.path.getsize(self.recv_log_path)
-            if size > 50 * 1024 * 1024:
-                idx = self.recv_log_path_list.index(self.recv_log_path)
-                if idx == 0:
-                    self.recv_log_path = self.recv_log_path_list[1]
-                else:
-                    self.recv_log_path = self.recv_log_path_list[0]
-                if os.path.exists(self.recv_log_path):
-                    size = os.path.getsize(self.recv_log_path)
-                    if size >= 50 * 1024 * 1024:
-                        with open(self.recv_log_path, 'w') as f:
-                            pass
-
-        with open(self.recv_log_path, 'a') as f:
-            now_time = datetime.datetime.now()
-            f.write('time: {}, type:{}, info：{}\n'.format(now_time, info_type, log_info))
-            f.write('=' * 40 + '\n')
+        now_time = datetime.datetime.now()
+        data = 'time: {}, type:{}, info：{}\n{}\n'.format(now_time, info_type, log_info, '=' * 40).encode('utf-8')
+        with self._lock:
+            if self._stream is None:
+                self._open()
+            if self._size and self._size + len(data) > self.max_bytes:
+                self._rotate()
+            self._stream.write(data)
+            self._size += len(data)
+            self._dirty = True
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            if self._stream is not None:
+                self._flush()
+
+    def close(self):
+        self._stop.set()
+        with self._lock:
+            if self._stream is not None:
+                self._flush()
+                self._stream.close()
+                self._stream = None
+
+    def _run_flusher(self):
+        '''后台定时刷新，避免空闲时缓冲区中的日志长时间不落盘'''
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                if self._stream is not None and self._dirty:
+                    self._flush()
+
+    def _open(self):
+        dir_name = os.path.dirname(self.recv_log_path)
+        if dir_name and not os.path.exists(dir_name):
+            os.makedirs(dir_name)
+        self._stream = open(self.recv_log_path, 'ab', buffering=self.buffer_size)
+        self._size = self._stream.tell()
+        if self.flush_interval > 0 and (self._flusher is None or not self._flusher.is_alive()):
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._run_flusher, name='mqtt-recv-log-flush', daemon=True)
+            self._flusher.start()
+
+    def _flush(self):
+        self._stream.flush()
+        if self.fsync:
+            os.fsync(self._stream.fileno())
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def _rotate(self):
+        self._flush()
+        self._stream.close()
+        self._stream = None
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                src = '{}.{}'.format(self.recv_log_path, i)
+                if os.path.exists(src):
+                    os.replace(src, '{}.{}'.format(self.recv_log_path, i + 1))
+            os.replace(self.recv_log_path, '{}.1'.format(self.recv_log_path))
+        else:
+            os.remove(self.recv_log_path)
+        self._open()
 
 
 class MidnightRotatingFileHandler(BaseRotatingHandler):
@@ -230,6 +471,10 @@ def setup_log():
     '''配置日志'''
     if not os.path.exists('./logs'):
         os.mkdir('./logs')
+    from demo_text.utils.getip import resolve_host_ip, start_host_ip_refresh
+    # 本机IP只在启动时解析一次，日志记录时不再做网络操作
+    resolve_host_ip()
+    start_host_ip_refresh()
     logging.basicConfig(level=Config.LOG_LEVEL, datefmt='%Y-%m-%d %H:%M:%S')
     # file_log_handler = RotatingFileHandler('logs/log', maxBytes=1024 * 1024 * 100, backupCount=10, encoding='UTF-8')
     file_log_handler = MidnightRotatingFileHandler('logs/log', backupCount=2, encoding='UTF-8')
@@ -238,3 +483,8 @@ def setup_log():
     file_log_handler.setFormatter(formatter)
     file_log_handler.setLevel(Config.LOG_LEVEL)
     logging.getLogger().addHandler(file_log_handler)
+
+
+# 放在最后导入：先执行 python -m log.xxx 时 demo_text 会反过来导入本模块，
+# 此时上面的类和函数已经定义完成
+from demo_text.utils.getip import get_client_ip, get_host_ip_long  # noqa: E402
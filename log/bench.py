@@ -0,0 +1,13 @@
+'''
+AsyncSink 吞吐测试，见 log.sink.benchmark
+
+usage:
+    python -m log.bench [messages] [threads]
+'''
+import sys
+
+from log.sink import benchmark
+
+if __name__ == '__main__':
+    benchmark(messages=int(sys.argv[1]) if len(sys.argv) > 1 else 200000,
+              threads=int(sys.argv[2]) if len(sys.argv) > 2 else 4)
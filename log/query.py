@@ -0,0 +1,190 @@
+'''
+结构化日志（JSON lines）查询工具
+
+usage:
+    python -m log.query [--since TIME] [--until TIME] [--family system] [--level ERROR]
+                        [--device-key KEY] [path ...]
+
+path 可以是文件、目录或通配符，默认查询 LOG_BASE_PATH 下的所有日志文件，支持 .gz 压缩文件。
+未压缩文件会在旁边生成稀疏时间索引 {file}.idx，按时间范围查询时直接定位到起始偏移
+'''
+import argparse
+import bisect
+import datetime
+import glob
+import gzip
+import json
+import os
+import sys
+
+INDEX_SUFFIX = '.idx'
+# 每隔多少字节记录一个索引点
+INDEX_STEP = 1024 * 1024
+
+
+def parse_time(value):
+    '''解析时间参数，支持时间戳、YYYY-MM-DD、YYYY-MM-DD HH:MM:SS'''
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError('invalid time: {}'.format(value))
+
+
+def line_time(line):
+    try:
+        return json.loads(line)['time']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class SparseTimeIndex(object):
+    '''
+    日志文件的稀疏时间索引，entries 为 [(时间, 偏移), ...]，每 INDEX_STEP 字节一条。
+    日志文件只追加，文件变大时从上次索引位置继续建立，变小时（被轮转或截断）重建
+    '''
+
+    def __init__(self, path, step=INDEX_STEP):
+        self.path = path
+        self.step = step
+        self.size = 0
+        self.entries = []
+
+    def load(self):
+        try:
+            with open(self.path + INDEX_SUFFIX, 'r') as f:
+                data = json.load(f)
+            self.size = data['size']
+            self.entries = [tuple(entry) for entry in data['entries']]
+        except (OSError, ValueError, KeyError):
+            self.size = 0
+            self.entries = []
+        return self
+
+    def update(self):
+        size = os.path.getsize(self.path)
+        if size < self.size:
+            self.size = 0
+            self.entries = []
+        if size == self.size:
+            return self
+
+        next_offset = self.entries[-1][1] + self.step if self.entries else 0
+        with open(self.path, 'rb') as f:
+            f.seek(self.size)
+            offset = self.size
+            for line in f:
+                if offset >= next_offset:
+                    ts = line_time(line)
+                    if ts is not None:
+                        self.entries.append((ts, offset))
+                        next_offset = offset + self.step
+                offset += len(line)
+                if not line.endswith(b'\n'):
+                    # 最后一行可能尚未写完，下次再索引
+                    offset -= len(line)
+                    break
+            self.size = offset
+        self.save()
+        return self
+
+    def save(self):
+        try:
+            with open(self.path + INDEX_SUFFIX, 'w') as f:
+                json.dump({'size': self.size, 'entries': self.entries}, f)
+        except OSError:
+            pass
+
+    def seek_offset(self, since):
+        '''返回时间不晚于 since 的最后一个索引点的偏移'''
+        if since is None or not self.entries:
+            return 0
+        times = [entry[0] for entry in self.entries]
+        idx = bisect.bisect_left(times, since) - 1
+        return self.entries[idx][1] if idx >= 0 else 0
+
+
+def iter_lines(path, since=None):
+    '''按时间范围逐行读取日志文件，未压缩文件用稀疏索引定位起始位置'''
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            for line in f:
+                yield line
+        return
+
+    offset = SparseTimeIndex(path).load().update().seek_offset(since)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            yield line
+
+
+def match(record, args):
+    if args.family and record.get('family') != args.family:
+        return False
+    if args.level and str(record.get('level', '')).upper() != args.level.upper():
+        return False
+    if args.device_key and record.get('device_key') != args.device_key:
+        return False
+    return True
+
+
+def query(paths, args, out=sys.stdout):
+    count = 0
+    for path in paths:
+        for line in iter_lines(path, args.since):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            ts = record.get('time')
+            if ts is None:
+                continue
+            if args.since is not None and ts < args.since:
+                continue
+            if args.until is not None and ts > args.until:
+                # 单个文件内日志按时间顺序写入
+                break
+            if match(record, args):
+                out.write(line.decode('utf-8').rstrip('\n') + '\n')
+                count += 1
+    return count
+
+
+def expand_paths(paths):
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            path = os.path.join(path, '**', '*.log*')
+        for name in sorted(glob.glob(path, recursive=True)):
+            if os.path.isfile(name) and not name.endswith(INDEX_SUFFIX):
+                result.append(name)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='query structured (JSON lines) logs')
+    parser.add_argument('paths', nargs='*', help='log files, directories or glob patterns')
+    parser.add_argument('--since', type=parse_time, help='start time')
+    parser.add_argument('--until', type=parse_time, help='end time')
+    parser.add_argument('--family', choices=('system', 'operate', 'device'), help='log family')
+    parser.add_argument('--level', help='log level of system logs, e.g. ERROR')
+    parser.add_argument('--device-key', dest='device_key', help='device key of device logs')
+    args = parser.parse_args(argv)
+
+    paths = args.paths
+    if not paths:
+        from settings import Config
+        paths = [Config.LOG_BASE_PATH]
+    query(expand_paths(paths), args)
+
+
+if __name__ == '__main__':
+    main()
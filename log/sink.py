@@ -0,0 +1,187 @@
+import atexit
+import collections
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+
+class AsyncSink(object):
+    '''
+    异步批量日志输出
+    请求线程只把格式化好的日志放入有界缓冲区，由后台线程按条数或时间批量交给 writer 写出。
+    缓冲区满时的策略:
+        block  阻塞等待缓冲区有空位
+        drop   丢弃新日志
+        sample 每 sample_rate 条保留 1 条，替换缓冲区中最早的日志
+    '''
+    BLOCK = 'block'
+    DROP = 'drop'
+    SAMPLE = 'sample'
+
+    def __init__(self, writer, queue_size=10000, batch_size=500, flush_interval=0.5,
+                 overflow=BLOCK, sample_rate=10, name='async-log-sink'):
+        '''
+        :param writer: 写出函数，参数为日志字符串列表
+        :param queue_size: 缓冲区最大条数
+        :param batch_size: 每批最大条数，缓冲区达到该条数时立即写出
+        :param flush_interval: 最长写出间隔（秒）
+        :param overflow: 缓冲区满时的策略，block、drop 或 sample
+        :param sample_rate: sample 策略的采样间隔
+        '''
+        if overflow not in (self.BLOCK, self.DROP, self.SAMPLE):
+            raise ValueError('unknown overflow policy: {}'.format(overflow))
+        self.writer = writer
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.sample_rate = max(int(sample_rate), 1)
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._overflowed = 0
+        self._buffer = collections.deque()
+        self._writing = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def __call__(self, message):
+        self.put(str(message))
+
+    def put(self, message):
+        with self._cond:
+            if len(self._buffer) >= self.queue_size:
+                if self.overflow == self.BLOCK:
+                    while len(self._buffer) >= self.queue_size and not self._stopping:
+                        self._cond.wait()
+                elif self.overflow == self.DROP:
+                    self.dropped += 1
+                    return
+                else:
+                    self._overflowed += 1
+                    self.dropped += 1
+                    if self._overflowed % self.sample_rate:
+                        return
+                    self._buffer.popleft()
+            self._buffer.append(message)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        '''等待缓冲区中的日志全部写出'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify_all()
+            while (self._buffer or self._writing) and self._thread.is_alive():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else self.flush_interval)
+        return True
+
+    def stop(self, timeout=5):
+        '''停止后台线程，退出前写出剩余日志'''
+        with self._cond:
+            if self._stopping:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while len(self._buffer) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                count = min(len(self._buffer), self.batch_size)
+                batch = [self._buffer.popleft() for _ in range(count)]
+                self._writing = count
+                dropped = self.dropped - self._reported_dropped
+                self._reported_dropped = self.dropped
+                stopping = self._stopping and not self._buffer
+                self._cond.notify_all()
+
+            if batch:
+                try:
+                    self.writer(batch)
+                except Exception as e:
+                    logging.getLogger(__name__).error('async log sink write failed: %s', e)
+                with self._cond:
+                    self._writing = 0
+                    self._cond.notify_all()
+            if dropped:
+                logging.getLogger(__name__).warning('async log sink dropped %d messages', dropped)
+            if stopping:
+                return
+
+
+def benchmark(messages=200000, threads=4, queue_size=1000, out=sys.stdout):
+    '''
+    对比同步文件 sink 与 AsyncSink 各溢出策略的吞吐
+    producer 为调用方线程写完全部日志的耗时（请求线程感知到的开销），total 包含等待后台写完
+    usage:
+        python -m log.bench [messages] [threads]
+
+    :param messages: 日志总条数
+    :param threads: 写日志的线程数
+    :param queue_size: AsyncSink 缓冲区大小
+    '''
+    from loguru import logger
+
+    per_thread = messages // threads
+    message = 'benchmark|INFO|' + 'x' * 120
+    directory = tempfile.mkdtemp(prefix='log-sink-bench-')
+
+    def produce():
+        workers = [threading.Thread(target=lambda: [logger.info(message) for _ in range(per_thread)])
+                   for _ in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return time.perf_counter() - start
+
+    try:
+        logger.remove()
+        for policy in ('sync', AsyncSink.BLOCK, AsyncSink.DROP, AsyncSink.SAMPLE):
+            path = os.path.join(directory, '{}.log'.format(policy))
+            if policy == 'sync':
+                handler_id = logger.add(path, format='{time:X}|{message}')
+                sink = None
+            else:
+                f = open(path, 'a')
+
+                def write_batch(batch, f=f):
+                    f.write(''.join(batch))
+                    f.flush()
+
+                sink = AsyncSink(write_batch, queue_size=queue_size, overflow=policy)
+                handler_id = logger.add(sink, format='{time:X}|{message}')
+
+            start = time.perf_counter()
+            producer = produce()
+            if sink is not None:
+                sink.flush()
+            total = time.perf_counter() - start
+            logger.remove(handler_id)
+            if sink is not None:
+                sink.stop()
+                f.close()
+            with open(path) as f:
+                written = sum(1 for _ in f)
+            count = per_thread * threads
+            out.write('{:<7} producer {:>9.0f} msg/s  total {:>9.0f} msg/s  written {:>7}  dropped {:>7}\n'.format(
+                policy, count / producer, count / total, written, sink.dropped if sink else 0))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
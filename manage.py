@@ -1,12 +1,17 @@
+import eventlet
+
+# conn_info 使用阻塞的 BRPOP，需要让 redis 的 socket 操作让出协程
+eventlet.monkey_patch()
 
 import json
-import threading
-from flask import current_app
 from flask_apscheduler import APScheduler
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room
 
-from demo_text import create_app
+from demo_text import create_app, db
 from demo_text import redis_store
+from demo_text.utils.leader import LeaderLock, run_as_leader
+from demo_text.utils.redis_client import pop_many
+from demo_text.utils.state import state_publisher, car_room, operation_room, PLATFORM_ROOM
 from settings import Config
 
 app = create_app()
@@ -17,27 +22,118 @@ scheduler.init_app(app)
 if scheduler.state == 0:
     scheduler.start()
 
-thread1 = None
-thread2 = None
-thread3 = None
-thread_lock = threading.Lock()
+# 多 worker 部署时只有 leader 运行后台消费任务
+consumer_lock = LeaderLock('socketio_consumers', ttl=getattr(Config, 'LEADER_LOCK_TTL', 10))
+
+CONN_CHANGE_KEY = 'conn_change'
+# 连接变化合并窗口（秒），窗口内的变化合并为一次推送
+CONN_CHANGE_INTERVAL = getattr(Config, 'CONN_CHANGE_INTERVAL', 0.2)
+CONN_CHANGE_BATCH = 500
+# 状态差量的定时检查间隔（秒）
+STATE_REFRESH_INTERVAL = getattr(Config, 'STATE_REFRESH_INTERVAL', 2)
+
+
+def parse_conn_change(raw):
+    '''
+    解析连接变化消息，格式: {"car_id": 1, "plat_id": 2, "conn_status": 1}
+    '''
+    try:
+        data = json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    return {
+        'car_id': data.get('car_id'),
+        'plat_id': data.get('plat_id'),
+        'conn_status': data.get('conn_status'),
+    }
+
+
+def drain_conn_change(max_count=CONN_CHANGE_BATCH):
+    '''一次取出队列中最早的 max_count 条消息，按入队顺序返回'''
+    return pop_many(redis_store, CONN_CHANGE_KEY, max_count)
 
 
-def conn_info(socketio):
-    while True:
-        socketio.sleep(0.01)
+def conn_info(socketio, lock, term):
+    while lock.holds(term):
         try:
-            conn_change = redis_store.rpop('conn_change')
-            if conn_change:
-                socketio.emit('server_response', {'type': 3}, namespace='/info')
+            item = redis_store.brpop(CONN_CHANGE_KEY, timeout=5)
+            if not item:
+                continue
+            if not lock.holds(term):
+                # 阻塞期间任期已结束，消息放回队尾交给新任期的消费者
+                redis_store.rpush(CONN_CHANGE_KEY, item[1])
+                break
+            # 等待合并窗口结束，把这段时间内的变化合并为一次推送
+            socketio.sleep(CONN_CHANGE_INTERVAL)
+            raw_changes = [item[1]] + drain_conn_change()
+            changes = {}
+            for raw in raw_changes:
+                change = parse_conn_change(raw)
+                if change is not None:
+                    changes[(change['car_id'], change['plat_id'])] = change
+            socketio.emit('server_response', {'type': 3, 'changes': list(changes.values())},
+                          namespace='/info')
+            refresh_state()
         except Exception as e:
-            current_app.logger.error(e)
+            app.logger.error(e)
+            socketio.sleep(1)
+
+
+def refresh_state():
+    with app.app_context():
+        try:
+            state_publisher.refresh()
+        finally:
+            db.session.remove()
+
+
+def state_info(socketio, lock, term):
+    while lock.holds(term):
+        socketio.sleep(STATE_REFRESH_INTERVAL)
+        if not lock.holds(term):
+            break
+        try:
+            refresh_state()
+        except Exception as e:
+            app.logger.error(e)
+
+
+def state_rooms(data):
+    data = data if isinstance(data, dict) else {}
+    rooms = []
+    if data.get('car_id') is not None:
+        rooms.append(car_room(data['car_id']))
+    if data.get('operation_id') is not None:
+        rooms.append(operation_room(data['operation_id']))
+    if data.get('platforms'):
+        rooms.append(PLATFORM_ROOM)
+    return rooms
+
+
+def register_socket_events(socketio):
+    @socketio.on('subscribe', namespace='/info')
+    def on_subscribe(data):
+        '''订阅状态差量，data: {"car_id": 1} / {"operation_id": 1} / {"platforms": true}'''
+        for room in state_rooms(data):
+            join_room(room)
+
+    @socketio.on('unsubscribe', namespace='/info')
+    def on_unsubscribe(data):
+        for room in state_rooms(data):
+            leave_room(room)
+
+
+def start_consumers(socketio, lock, term):
+    # 期间可能有其他 worker 做过 leader，重新加载状态快照
+    state_publisher.reset()
+    socketio.start_background_task(state_info, socketio, lock, term)
+    socketio.start_background_task(conn_info, socketio, lock, term)
+
 
 def get_data_list(socketio):
-    global thread1, thread2
-    with thread_lock:
-        if thread2 is None:
-            thread2 = socketio.start_background_task(conn_info, socketio)
+    run_as_leader(socketio, consumer_lock, start_consumers, logger=app.logger)
 
 
 if __name__ == '__main__':
@@ -47,9 +143,12 @@ if __name__ == '__main__':
                       trigger='cron', day_of_week='0-6', hour=0, minute=0, second=0)
 
     # 配置socket服务
+    # 多 worker 通过 redis 消息队列转发推送
     socketio = SocketIO(app, cors_allowed_origins="*")
     async_mode = 'eventlet'
-    socketio.init_app(app, async_mode=async_mode)
+    socketio.init_app(app, async_mode=async_mode, message_queue=Config.SOCKETIO_MESSAGE_QUEUE)
+    state_publisher.init_socketio(socketio, namespace='/info')
+    register_socket_events(socketio)
 
     socketio.start_background_task(get_data_list, socketio)
 
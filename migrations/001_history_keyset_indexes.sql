@@ -0,0 +1,17 @@
+-- 历史数据游标分页（demo_text/utils/pagination.py）使用的索引
+-- 排序为 (排序字段, id)，InnoDB 二级索引自带主键，因此 (car_id, 排序字段) 即可覆盖按车辆过滤后的排序
+-- usage: mysql -u root -p demo_text < migrations/001_history_keyset_indexes.sql
+
+ALTER TABLE `taskdetail`
+    ADD INDEX `idx_taskdetail_carid_createat` (`carid`, `createat`),
+    ADD INDEX `idx_taskdetail_carid_begintime` (`carid`, `begintime`),
+    ADD INDEX `idx_taskdetail_createat` (`createat`);
+
+ALTER TABLE `car_everyday`
+    ADD INDEX `idx_car_everyday_car_datatime` (`car_id`, `datatime`),
+    ADD INDEX `idx_car_everyday_datatime` (`datatime`);
+
+ALTER TABLE `conn_info`
+    ADD INDEX `idx_conn_info_car_create_at` (`car_id`, `create_at`),
+    ADD INDEX `idx_conn_info_car_begin_time` (`car_id`, `begin_time`),
+    ADD INDEX `idx_conn_info_create_at` (`create_at`);
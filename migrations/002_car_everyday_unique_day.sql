@@ -0,0 +1,21 @@
+-- car_everyday 每辆车每天一行，每日汇总（demo_text/utils/rollup.py）依赖该唯一索引做 INSERT ... ON DUPLICATE KEY UPDATE
+-- 需在 001_history_keyset_indexes.sql 之后执行
+-- usage: mysql -u root -p demo_text < migrations/002_car_everyday_unique_day.sql
+
+-- 合并已有的重复行：保留 id 最小的一行，时长、里程取合计
+UPDATE `car_everyday` AS e
+JOIN (
+    SELECT MIN(`id`) AS `id`, SUM(`atime`) AS `atime`, SUM(`mileage`) AS `mileage`
+    FROM `car_everyday`
+    GROUP BY `car_id`, `datatime`
+    HAVING COUNT(*) > 1
+) AS d ON d.`id` = e.`id`
+SET e.`atime` = d.`atime`, e.`mileage` = d.`mileage`;
+
+DELETE e FROM `car_everyday` AS e
+JOIN `car_everyday` AS k
+    ON k.`car_id` = e.`car_id` AND k.`datatime` = e.`datatime` AND k.`id` < e.`id`;
+
+ALTER TABLE `car_everyday`
+    DROP INDEX `idx_car_everyday_car_datatime`,
+    ADD UNIQUE INDEX `uk_car_everyday_car_datatime` (`car_id`, `datatime`);
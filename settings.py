@@ -2,8 +2,10 @@ import logging
 import os
 
 import pymysql
+from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.jobstores.redis import RedisJobStore
 from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from redis import BlockingConnectionPool
 from yaml import load
 
 try:
@@ -54,11 +56,29 @@ LOG_BASE_PATH: /tmp/demo_text
 LOG_LEVEL: error
 LOG_SIZE: 50
 LOG_COUNT: 2
+# 相同位置的请求异常在该时间（秒）内只记录一次完整日志，0 表示不限流
+ERROR_LOG_WINDOW: 60
+# 本机IP，配置后不再自动探测
+# LOCAL_IP: 192.168.1.100
+# 本机IP刷新间隔（秒），0 表示只在启动时解析
+LOCAL_IP_REFRESH_INTERVAL: 0
+# 慢请求日志阈值: sql 条数、sql 总耗时（秒），0 表示不检查；日志中记录最慢的语句条数
+SLOW_REQUEST_QUERIES: 50
+SLOW_REQUEST_DB_TIME: 0.5
+SLOW_QUERY_TOP: 5
 LOG_MANAGER_CONFIG:
     LOG_HANDLERS:
         - name: system_log
           file: 'demo_text/autopilot_{time:YYYY-MM-DD}.log'
           filter: system
+          # 输出 JSON lines，可用 python -m log.query 查询
+          # structured: true
+          # 异步批量写出，overflow 可选 block、drop、sample
+          async:
+            queue_size: 10000
+            batch_size: 500
+            flush_interval: 0.5
+            overflow: block
           options:
             retention: '30 days'
             format: '{time:X}|{message}'
@@ -80,9 +100,28 @@ DATABASE:
 REDIS_HOST: 127.0.0.1
 REDIS_PORT: 6379
 REDIS_DB: 6
+# 集群模式（依赖 redis-py-cluster），定时任务存储 redis 在集群模式下改用内存存储
 REDIS_CLUSTER_FLAG: False
+# 集群节点，REDIS_CLUSTER_FLAG 为 True 时使用，默认为上面的 host/port
+# REDIS_CLUSTER_NODES:
+#     - host: 127.0.0.1
+#       port: 7000
+# 连接池配置
+REDIS_MAX_CONNECTIONS: 50
+REDIS_POOL_TIMEOUT: 5
+REDIS_SOCKET_TIMEOUT: 10
+REDIS_SOCKET_CONNECT_TIMEOUT: 3
+REDIS_HEALTH_CHECK_INTERVAL: 30
+# socketio 多 worker 消息队列，默认使用上面的 redis，集群模式下为第一个集群节点的 db 0
+# SOCKETIO_MESSAGE_QUEUE: redis://127.0.0.1:6379/6
+# 后台任务 leader 锁过期时间（秒）
+LEADER_LOCK_TTL: 10
+# 每日汇总回看时长（秒），重新汇总水位之前这段时间内完成的任务
+ROLLUP_OVERLAP: 3600
 EXPIRATION: 86400
 APP_EXPIRATION: 604800
+# 已验证 token 的缓存时长（秒）；用户变化通过 redis 版本号通知各 worker，redis 不可用时不使用缓存
+TOKEN_CACHE_TTL: 60
 PERMANENT_SESSION_LIFETIME: 86400
 # SESSION_TYPE: redis
 ### http server config
@@ -120,12 +159,40 @@ class ConfigManager(object):
         conf['SQLALCHEMY_POOL_RECYCLE'] = 3600
         conf['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+        if 'SOCKETIO_MESSAGE_QUEUE' not in conf:
+            if conf.get('REDIS_CLUSTER_FLAG', False):
+                # 集群只有 db 0，PUBLISH 会转发到所有节点，消息队列连接任一节点即可
+                node = (conf.get('REDIS_CLUSTER_NODES') or [{'host': conf['REDIS_HOST'], 'port': conf['REDIS_PORT']}])[0]
+                conf['SOCKETIO_MESSAGE_QUEUE'] = 'redis://{}:{}/0'.format(node['host'], node['port'])
+            else:
+                conf['SOCKETIO_MESSAGE_QUEUE'] = 'redis://{}:{}/{}'.format(
+                    conf['REDIS_HOST'], conf['REDIS_PORT'], conf['REDIS_DB'])
+
         conf['REDIS_KEY_ACTUAL_DELAY'] = "actual_delay"
         conf['REDIS_KEY_PROPERTY'] = "property"
         conf['REDIS_KEY_EVENT_SERVICE'] = "event_service"
 
+        # redis 连接池配置，redis_store 与定时任务存储使用同一份配置
+        conf['REDIS_POOL_OPTIONS'] = {
+            'host': conf['REDIS_HOST'],
+            'port': conf['REDIS_PORT'],
+            'db': conf['REDIS_DB'],
+            'max_connections': conf.get('REDIS_MAX_CONNECTIONS', 50),
+            'timeout': conf.get('REDIS_POOL_TIMEOUT', 5),
+            'socket_timeout': conf.get('REDIS_SOCKET_TIMEOUT', 10),
+            'socket_connect_timeout': conf.get('REDIS_SOCKET_CONNECT_TIMEOUT', 3),
+            'health_check_interval': conf.get('REDIS_HEALTH_CHECK_INTERVAL', 30),
+        }
+
+        if conf.get('REDIS_CLUSTER_FLAG', False):
+            # RedisJobStore 使用 MULTI 事务并同时写两个 key（跨 slot），集群不支持；
+            # 集群模式下改用内存存储，各 worker 启动时重新添加任务，由任务内的 leader 锁保证只执行一次
+            redis_jobstore = MemoryJobStore()
+        else:
+            # 任务存储需要二进制数据（pickle），不能与 decode_responses 的 redis_store 共用连接
+            redis_jobstore = RedisJobStore(connection_pool=BlockingConnectionPool(**conf['REDIS_POOL_OPTIONS']))
         conf['SCHEDULER_JOBSTORES'] = {
-            'redis': RedisJobStore(db=conf['REDIS_DB'], host=conf['REDIS_HOST'], port=conf['REDIS_PORT']),
+            'redis': redis_jobstore,
             'mysql': SQLAlchemyJobStore(url="mysql://{USER}:{PASSWORD}@{HOST}:{PORT}/{DATABASE}?charset=utf8".format(
                 **conf['DATABASE']['DEFAULT']))
         }
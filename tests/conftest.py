@@ -0,0 +1,57 @@
+import datetime
+
+import pytest
+from sqlalchemy.dialects.mysql import TINYINT
+from sqlalchemy.ext.compiler import compiles
+
+from demo_text import create_app, db, middle_manger
+from demo_text.models.models import CarEveryday, ConnectDevice, Taskdetail
+from settings import Config
+
+# 测试使用 sqlite，只创建用到的表
+TABLES = (CarEveryday, ConnectDevice, Taskdetail)
+HEADERS = {'speepertoken': 'token'}
+
+
+@compiles(TINYINT, 'sqlite')
+def compile_tinyint(type_, compiler, **kw):
+    return 'INTEGER'
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    url = 'sqlite:///{}'.format(tmp_path / 'test.db')
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', url)
+    monkeypatch.setattr(Config, 'MASTER_DATABASE_URI', url)
+    monkeypatch.setattr(Config, 'SECRET_KEY', 'test', raising=False)
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        for model in TABLES:
+            model.__table__.create(db.engine)
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    '''已登录的 test_client，请求时带上 HEADERS'''
+    monkeypatch.setattr(middle_manger, 'verifier', lambda token: 'user')
+    return app.test_client()
+
+
+def make_taskdetail(**kwargs):
+    now = kwargs.pop('createat', datetime.datetime(2024, 1, 1, 8))
+    values = dict(taskid=1, carid=1, carnum='A1', taskstu=5, taskbegintime=now, begintime=now,
+                  endtime=now + datetime.timedelta(hours=1), taskfrequency=1, createat=now)
+    values.update(kwargs)
+    return Taskdetail(**values)
+
+
+def make_conn_info(**kwargs):
+    now = kwargs.pop('create_at', datetime.datetime(2024, 1, 1, 8))
+    values = dict(car_id=1, plat_id=1, conn_status=1, create_at=now, begin_time=now,
+                  end_time=now + datetime.timedelta(minutes=5), type=1)
+    values.update(kwargs)
+    return ConnectDevice(**values)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from demo_text.utils.coords import WGS84ToBD09
+
+# 国内、边界附近以及国外（不做偏移）的坐标
+POINTS = [
+    (116.397128, 39.916527),
+    (121.473701, 31.230416),
+    (113.264385, 23.129112),
+    (87.617733, 43.792818),
+    (73.70, 39.40),
+    (135.00, 48.40),
+    (-122.419416, 37.774929),
+    (2.352222, 48.856613),
+    (151.209290, -33.868820),
+    (139.691711, 35.689487),
+    (0.0, 0.0),
+]
+
+CONVERSIONS = [
+    ('wgs84_to_gcj02', 'wgs84_to_gcj02_many'),
+    ('gcj02_to_wgs84', 'gcj02_to_wgs84_many'),
+    ('gcj02_to_bd09', 'gcj02_to_bd09_many'),
+    ('bd09_to_gcj02', 'bd09_to_gcj02_many'),
+    ('wgs84_to_bd09', 'wgs84_to_bd09_many'),
+    ('bd09_to_wgs84', 'bd09_to_wgs84_many'),
+]
+
+
+@pytest.fixture
+def converter():
+    return WGS84ToBD09()
+
+
+@pytest.mark.parametrize('scalar, many', CONVERSIONS)
+def test_many_matches_scalar(converter, scalar, many):
+    lngs = [p[0] for p in POINTS]
+    lats = [p[1] for p in POINTS]
+    out_lngs, out_lats = getattr(converter, many)(lngs, lats)
+    assert len(out_lngs) == len(POINTS)
+    for i, (lng, lat) in enumerate(POINTS):
+        expected = getattr(converter, scalar)(lng, lat)
+        assert out_lngs[i] == pytest.approx(expected[0], abs=1e-9)
+        assert out_lats[i] == pytest.approx(expected[1], abs=1e-9)
+
+
+@pytest.mark.parametrize('scalar, many', CONVERSIONS)
+def test_many_accepts_point_array(converter, scalar, many):
+    separate = getattr(converter, many)([p[0] for p in POINTS], [p[1] for p in POINTS])
+    paired = getattr(converter, many)(np.array(POINTS))
+    flat = getattr(converter, many)([v for p in POINTS for v in p])
+    for result in (paired, flat):
+        np.testing.assert_array_equal(result[0], separate[0])
+        np.testing.assert_array_equal(result[1], separate[1])
+
+
+def test_out_of_china_points_unchanged(converter):
+    outside = [p for p in POINTS if converter.out_of_china(*p)]
+    assert outside
+    lngs, lats = converter.wgs84_to_gcj02_many([p[0] for p in outside], [p[1] for p in outside])
+    np.testing.assert_array_equal(lngs, [p[0] for p in outside])
+    np.testing.assert_array_equal(lats, [p[1] for p in outside])
+
+
+def test_out_of_china_many_matches_scalar(converter):
+    lngs = np.array([p[0] for p in POINTS])
+    lats = np.array([p[1] for p in POINTS])
+    expected = [converter.out_of_china(lng, lat) for lng, lat in POINTS]
+    assert converter.out_of_china_many(lngs, lats).tolist() == expected
+
+
+def test_random_points_match_scalar(converter):
+    rng = np.random.RandomState(1)
+    lngs = rng.uniform(60.0, 140.0, 1000)
+    lats = rng.uniform(0.0, 55.0, 1000)
+    out_lngs, out_lats = converter.wgs84_to_bd09_many(lngs, lats)
+    expected = np.array([converter.wgs84_to_bd09(lng, lat) for lng, lat in zip(lngs, lats)])
+    np.testing.assert_allclose(out_lngs, expected[:, 0], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(out_lats, expected[:, 1], rtol=0, atol=1e-9)
+
+
+def test_empty_input(converter):
+    lngs, lats = converter.wgs84_to_bd09_many([], [])
+    assert len(lngs) == 0 and len(lats) == 0
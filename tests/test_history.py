@@ -0,0 +1,47 @@
+import datetime
+import json
+
+from demo_text import db
+from demo_text.controllers.adcl import history
+from demo_text.models.models import CarEveryday
+
+from conftest import HEADERS
+
+ROWS = 250
+
+
+def add_rows(count=ROWS):
+    day = datetime.datetime(2024, 1, 1)
+    db.session.add_all(CarEveryday(car_id=1, data=day, datatime=i, atime=i, mileage=0) for i in range(count))
+    db.session.commit()
+
+
+def test_careveryday_export(client):
+    add_rows()
+    data = client.get('/api/history/careveryday/', headers=HEADERS).get_json()
+    assert data['code'] == 200
+    assert [row['atime'] for row in data['data']] == list(range(ROWS))
+
+
+def test_careveryday_export_is_lazy(client, monkeypatch):
+    '''经过完整的中间件，第一批数据在最后一行读取之前就已输出'''
+    add_rows()
+    produced = []
+
+    def counting_yield_per(query, batch_size=1000):
+        for row in query:
+            produced.append(row.id)
+            yield row
+
+    monkeypatch.setattr(history, 'yield_per', counting_yield_per)
+    response = client.get('/api/history/careveryday/', headers=HEADERS, buffered=False)
+    assert produced == []
+
+    chunks = iter(response.response)
+    received = [next(chunks), next(chunks)]
+    assert 0 < len(produced) < ROWS
+
+    received.extend(chunks)
+    response.close()
+    assert len(produced) == ROWS
+    assert len(json.loads(b''.join(received))['data']) == ROWS
@@ -0,0 +1,155 @@
+import json
+import random
+import threading
+import time
+
+import fakeredis
+import pytest
+
+from demo_text.utils import state
+from demo_text.utils.leader import LeaderLock, run_as_leader
+from demo_text.utils.state import StatePublisher, STATE_SNAPSHOT_KEY
+
+
+class Stopped(BaseException):
+    pass
+
+
+class ThreadSocketIO(object):
+    '''用线程实现 run_as_leader 用到的 start_background_task、sleep，stop 后 sleep 抛出 Stopped 结束线程'''
+
+    def __init__(self):
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def start_background_task(self, target, *args):
+        def run():
+            try:
+                target(*args)
+            except Stopped:
+                pass
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        return thread
+
+    def sleep(self, seconds):
+        if self.stopped.wait(seconds):
+            raise Stopped()
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make_lock(server, ttl=0.3):
+    return LeaderLock('test', ttl=ttl, redis=fakeredis.FakeStrictRedis(server=server, decode_responses=True))
+
+
+def test_single_leader(server):
+    locks = [make_lock(server) for _ in range(5)]
+    assert [lock.acquire() for lock in locks].count(True) == 1
+
+
+def test_term_changes_on_reacquire(server):
+    lock = make_lock(server)
+    assert lock.acquire()
+    term = lock.term
+    lock.redis.delete(lock.key)
+    assert not lock.renew()
+    assert lock.acquire()
+    assert lock.is_leader
+    assert not lock.holds(term)
+    assert lock.holds(lock.term)
+
+
+def test_workers_under_load(server):
+    '''
+    多个 worker 竞争同一把锁，随机删除锁模拟续期超时，消费者随机阻塞模拟 BRPOP，
+    同一 worker 内不会有两个任期的消费者同时处理消息，结束时全部 worker 合计最多一个消费者
+    '''
+    alive = {}
+    working = {}
+    overlaps = []
+    guard = threading.Lock()
+
+    def consumer(socketio, lock, term):
+        with guard:
+            alive[lock.token] = alive.get(lock.token, 0) + 1
+        try:
+            while lock.holds(term):
+                time.sleep(random.uniform(0, 0.3))
+                if not lock.holds(term):
+                    break
+                with guard:
+                    working[lock.token] = working.get(lock.token, 0) + 1
+                    if working[lock.token] > 1:
+                        overlaps.append(lock.token)
+                time.sleep(0.01)
+                with guard:
+                    working[lock.token] -= 1
+        finally:
+            with guard:
+                alive[lock.token] -= 1
+
+    workers = []
+    for _ in range(4):
+        socketio = ThreadSocketIO()
+        lock = make_lock(server)
+        socketio.start_background_task(run_as_leader, socketio, lock, consumer)
+        workers.append((socketio, lock))
+
+    admin = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    deadline = time.time() + 3
+    while time.time() < deadline:
+        time.sleep(random.uniform(0.02, 0.2))
+        admin.delete('leader:test')
+
+    time.sleep(0.5)
+    assert not overlaps
+    with guard:
+        assert sum(alive.values()) <= 1
+    assert sum(1 for _, lock in workers if lock.is_leader) <= 1
+    assert sum(lock.term for _, lock in workers) > len(workers)
+
+    for socketio, lock in workers:
+        socketio.stopped.set()
+        lock.release()
+    for socketio, _ in workers:
+        for thread in socketio.threads:
+            thread.join(1)
+
+
+def test_snapshot_does_not_store_on_follower(monkeypatch):
+    client = fakeredis.FakeStrictRedis(decode_responses=True)
+    monkeypatch.setattr(state, 'redis_store', client)
+    current = {'cars': {1: {'carstu': 1, 'is_conn': 1, 'is_conn_server': 1, 'isonlineat': None}}}
+
+    def load(publisher):
+        return dict(current['cars']), {}, {1: {7}}
+
+    monkeypatch.setattr(StatePublisher, 'load', load)
+
+    follower = StatePublisher()
+    snapshot = follower.snapshot(operation_id=7)
+    assert snapshot['version'] == 0
+    assert list(snapshot['cars']) == ['1']
+    assert client.get(STATE_SNAPSHOT_KEY) is None
+
+    leader = StatePublisher()
+    assert leader.refresh(emit=False)[0] == 1
+    assert json.loads(client.get(STATE_SNAPSHOT_KEY))['version'] == 1
+    assert follower.snapshot()['version'] == 1
+
+
+def test_hold_renews_until_exit(server):
+    lock = make_lock(server, ttl=0.15)
+    assert lock.acquire()
+    with lock.hold():
+        time.sleep(0.5)
+        assert lock.is_leader
+        assert lock.redis.get(lock.key) == lock.token
+    assert not lock.is_leader
+    assert lock.redis.get(lock.key) is None
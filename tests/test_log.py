@@ -0,0 +1,36 @@
+import glob
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = '''
+import demo_text
+from log import Log
+
+for i in range(20):
+    Log.system(['INFO', 'async-line-{}'.format(i), {}])
+demo_text.log_manager.flush()
+'''
+
+
+def test_async_log_written_once(tmp_path):
+    '''异步 handler 的日志在 stderr 和日志文件中都只出现一次'''
+    with open(os.path.join(ROOT, 'demo_text.yaml')) as f:
+        config = re.sub(r'(?m)^LOG_BASE_PATH: .*$', 'LOG_BASE_PATH: {}'.format(tmp_path / 'logs'), f.read())
+    (tmp_path / 'demo_text.yaml').write_text(config)
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    result = subprocess.run([sys.executable, '-c', SCRIPT], cwd=str(tmp_path), env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+
+    files = glob.glob(str(tmp_path / 'logs' / 'demo_text' / '*.log'))
+    assert len(files) == 1
+    with open(files[0]) as f:
+        written = f.read()
+    for i in range(20):
+        line = 'async-line-{}|'.format(i)
+        assert result.stderr.count(line) == 1
+        assert written.count(line) == 1
@@ -0,0 +1,85 @@
+import pytest
+from flask import Flask
+
+from demo_text.exceptions import handle_exception
+from demo_text.middlewares import MiddlewareManger
+from demo_text.utils.metrics import COUNT, SIZE, request_metrics
+from demo_text.utils.response import Response
+
+HEADERS = {'speepertoken': 'token'}
+
+
+@pytest.fixture
+def produced():
+    return []
+
+
+@pytest.fixture
+def app(produced):
+    app = Flask(__name__)
+    MiddlewareManger().init_app(app, verifier=lambda token: 'user')
+
+    def rows():
+        for i in range(5):
+            produced.append(i)
+            yield {'id': i}
+
+    app.add_url_rule('/api/rows/', 'rows', lambda: Response.stream(rows(), chunk_size=1))
+    app.add_url_rule('/api/ping/', 'ping', lambda: Response.success('pong'))
+    request_metrics.reset()
+    yield app
+    request_metrics.reset()
+
+
+def test_streamed_response_not_consumed_by_hook(app, produced):
+    response = app.test_client().get('/api/rows/', headers=HEADERS, buffered=False)
+    assert response.headers['X-Request-Id']
+    assert produced == []
+    assert 'rows' not in request_metrics._stats
+
+    chunks = iter(response.response)
+    received = [next(chunks), next(chunks)]
+    assert produced == [0]
+
+    received.extend(chunks)
+    response.close()
+    assert produced == [0, 1, 2, 3, 4]
+    stats = request_metrics._stats['rows']
+    assert stats[COUNT] == 1
+    assert stats[SIZE] == sum(len(chunk) for chunk in received)
+
+
+def test_streamed_response_size(app):
+    response = app.test_client().get('/api/rows/', headers=HEADERS)
+    assert [row['id'] for row in response.get_json()['data']] == [0, 1, 2, 3, 4]
+    stats = request_metrics._stats['rows']
+    assert stats[COUNT] == 1
+    assert stats[SIZE] == len(response.get_data())
+
+
+def test_closed_before_iteration(app, produced):
+    response = app.test_client().get('/api/rows/', headers=HEADERS, buffered=False)
+    response.close()
+    assert produced == []
+    assert request_metrics._stats['rows'][COUNT] == 1
+
+
+def test_sized_response(app):
+    response = app.test_client().get('/api/ping/', headers=HEADERS)
+    stats = request_metrics._stats['ping']
+    assert stats[COUNT] == 1
+    assert stats[SIZE] == len(response.get_data())
+
+
+def test_metrics_public_with_custom_paths():
+    app = Flask(__name__)
+    app.config['AUTH_PUBLIC_PATHS'] = ['/api/open/']
+    app.register_error_handler(Exception, handle_exception)
+    MiddlewareManger().init_app(app, verifier=lambda token: None)
+    app.add_url_rule('/api/open/', 'open', lambda: Response.success('ok'))
+    app.add_url_rule('/api/ping/', 'ping', lambda: Response.success('pong'))
+    client = app.test_client()
+
+    assert client.get('/api/_metrics').status_code == 200
+    assert client.get('/api/open/').get_json()['code'] == 200
+    assert client.get('/api/ping/').get_json()['code'] == 100008
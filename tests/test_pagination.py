@@ -0,0 +1,110 @@
+import base64
+import datetime
+import json
+
+import pytest
+
+from demo_text import db
+from demo_text.exceptions import APIException
+from demo_text.models.models import Taskdetail
+from demo_text.utils.pagination import decode_cursor, encode_cursor, keyset_paginate
+
+from conftest import HEADERS, make_taskdetail
+
+URL = '/api/history/taskdetail/page/'
+DAY = datetime.datetime(2024, 1, 1, 8)
+
+
+@pytest.fixture
+def tasks(app):
+    '''20 行，createat 每 4 行相同，用于检查排序值相同时按 id 翻页'''
+    db.session.add_all(make_taskdetail(createat=DAY + datetime.timedelta(minutes=i // 4),
+                                       begintime=DAY - datetime.timedelta(minutes=i), carid=i % 2 + 1)
+                       for i in range(20))
+    db.session.commit()
+    return [(row.createat, row.id) for row in Taskdetail.query]
+
+
+def collect(client, limit, **args):
+    '''按 next_cursor 依次取完所有页，返回全部行'''
+    items = []
+    cursor = None
+    for _ in range(100):
+        query = dict(args, limit=limit)
+        if cursor:
+            query['cursor'] = cursor
+        data = client.get(URL, headers=HEADERS, query_string=query).get_json()
+        assert data['code'] == 200
+        page = data['data']
+        assert len(page['items']) <= limit
+        items.extend(page['items'])
+        cursor = page['next_cursor']
+        assert page['has_more'] == (cursor is not None)
+        if cursor is None:
+            return items
+    raise AssertionError('pagination did not finish')
+
+
+@pytest.mark.parametrize('value', [DAY, 1704067200, 'text', None])
+def test_cursor_round_trip(value):
+    token = encode_cursor('createat', 'desc', value, 42)
+    assert '=' not in token
+    assert decode_cursor(token) == ('createat', 'desc', value, 42)
+
+
+@pytest.mark.parametrize('token', [
+    'not-base64!',
+    base64.urlsafe_b64encode(b'not json').decode(),
+    base64.urlsafe_b64encode(b'[1, 2]').decode(),
+    base64.urlsafe_b64encode(b'["createat", "desc", ["d", "2024-13-01"], 1]').decode(),
+    base64.urlsafe_b64encode(b'["createat", "desc", 1, "x"]').decode(),
+])
+def test_decode_malformed_cursor(token):
+    with pytest.raises(APIException) as info:
+        decode_cursor(token)
+    assert info.value.error_code == 100005
+
+
+@pytest.mark.parametrize('limit', [1, 3, 4, 7, 20, 50])
+def test_desc_with_ties(client, tasks, limit):
+    items = collect(client, limit)
+    expected = sorted(tasks, reverse=True)
+    assert [item['id'] for item in items] == [row_id for _, row_id in expected]
+
+
+@pytest.mark.parametrize('limit', [3, 4])
+def test_asc_with_ties(client, tasks, limit):
+    items = collect(client, limit, order='asc')
+    assert [item['id'] for item in items] == [row_id for _, row_id in sorted(tasks)]
+
+
+def test_other_sort_key_and_filter(client, tasks):
+    items = collect(client, 3, sort='begintime', order='asc', carid=1)
+    rows = Taskdetail.query.filter(Taskdetail.carid == 1).order_by(Taskdetail.begintime, Taskdetail.id)
+    assert [item['id'] for item in items] == [row.id for row in rows]
+
+
+def test_empty(app):
+    page = keyset_paginate(Taskdetail)
+    assert page.to_dict() == {'items': [], 'next_cursor': None, 'has_more': False}
+
+
+def error_code(client, **args):
+    return client.get(URL, headers=HEADERS, query_string=args).get_json()['code']
+
+
+def test_invalid_cursor(client, tasks):
+    cursor = client.get(URL, headers=HEADERS, query_string={'limit': 2}).get_json()['data']['next_cursor']
+    sort, order, value, last_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+
+    # 篡改过的游标
+    assert error_code(client, cursor=cursor[:-3]) == 100005
+    assert error_code(client, cursor='%%%') == 100005
+    assert error_code(client, cursor=encode_cursor(sort, order, value, 'x')) == 100005
+    # 游标与本次请求的排序不一致
+    assert error_code(client, cursor=cursor, order='asc') == 100005
+    assert error_code(client, cursor=encode_cursor('id', order, value, last_id), sort='id') == 100005
+    assert error_code(client, sort='carnum') == 100005
+    assert error_code(client, order='up') == 100005
+    # 未篡改的游标可以继续翻页
+    assert error_code(client, cursor=cursor) == 200
@@ -0,0 +1,76 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine
+
+from demo_text import db
+from demo_text.models.models import CarEveryday
+from demo_text.utils.querystats import assert_max_queries, count_queries
+
+from conftest import HEADERS, make_conn_info, make_taskdetail
+
+PAGE_URLS = ('/api/history/taskdetail/page/', '/api/history/careveryday/page/', '/api/history/conninfo/page/')
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    yield engine
+    engine.dispose()
+
+
+def test_count_queries(engine):
+    with count_queries(top=2) as stats:
+        for i in range(3):
+            engine.execute('SELECT {}'.format(i))
+    assert stats.count == 3
+    assert stats.total > 0
+    assert len(stats.slowest_statements()) == 2
+
+    engine.execute('SELECT 1')
+    assert stats.count == 3
+
+
+def test_nested_count_queries(engine):
+    with count_queries() as outer:
+        engine.execute('SELECT 1')
+        with count_queries() as inner:
+            engine.execute('SELECT 2')
+    assert (outer.count, inner.count) == (2, 1)
+
+
+def test_assert_max_queries(engine):
+    with assert_max_queries(2) as stats:
+        engine.execute('SELECT 1')
+        engine.execute('SELECT 2')
+    assert stats.count == 2
+
+    with pytest.raises(AssertionError) as info:
+        with assert_max_queries(2):
+            for i in range(3):
+                engine.execute('SELECT {}'.format(i))
+    assert 'got 3' in str(info.value)
+    assert 'SELECT 2' in str(info.value)
+
+
+@pytest.fixture
+def history(app):
+    day = datetime.datetime(2024, 1, 1)
+    rows = []
+    for i in range(30):
+        rows.append(make_taskdetail(createat=day + datetime.timedelta(minutes=i)))
+        rows.append(make_conn_info(create_at=day + datetime.timedelta(minutes=i)))
+        rows.append(CarEveryday(car_id=1, data=day, datatime=i, atime=i, mileage=0))
+    db.session.add_all(rows)
+    db.session.commit()
+
+
+@pytest.mark.parametrize('url', PAGE_URLS)
+def test_page_endpoints_query_count(client, history, url):
+    '''每页只执行一条 sql，to_dict 不会触发额外查询'''
+    with assert_max_queries(1):
+        data = client.get(url, headers=HEADERS, query_string={'limit': 10}).get_json()['data']
+    assert len(data['items']) == 10
+    with assert_max_queries(1):
+        data = client.get(url, headers=HEADERS, query_string={'limit': 10, 'cursor': data['next_cursor']}).get_json()
+    assert len(data['data']['items']) == 10
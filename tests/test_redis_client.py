@@ -0,0 +1,171 @@
+import sys
+import threading
+import types
+
+import fakeredis
+import pytest
+from redis import BlockingConnectionPool, StrictRedis
+
+from demo_text.utils.redis_client import create_redis_store, hset_many, pipeline, pop_many, set_many
+
+POOL_OPTIONS = {
+    'host': '10.0.0.1',
+    'port': 6380,
+    'db': 3,
+    'max_connections': 7,
+    'timeout': 2,
+    'socket_timeout': 4,
+    'socket_connect_timeout': 1,
+    'health_check_interval': 15,
+}
+
+
+class StandaloneConfig(object):
+    REDIS_HOST = '10.0.0.1'
+    REDIS_PORT = 6380
+    REDIS_POOL_OPTIONS = POOL_OPTIONS
+    REDIS_CLUSTER_FLAG = False
+
+
+class ClusterConfig(StandaloneConfig):
+    REDIS_CLUSTER_FLAG = True
+    REDIS_CLUSTER_NODES = [{'host': '10.0.0.2', 'port': 7000}, {'host': '10.0.0.3', 'port': 7001}]
+
+
+@pytest.fixture
+def client():
+    return fakeredis.FakeStrictRedis(decode_responses=True)
+
+
+@pytest.fixture
+def rediscluster(monkeypatch):
+    '''替换 rediscluster 模块，记录 RedisCluster 的构造参数'''
+    module = types.ModuleType('rediscluster')
+
+    class RedisCluster(object):
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+    module.RedisCluster = RedisCluster
+    monkeypatch.setitem(sys.modules, 'rediscluster', module)
+    return module
+
+
+def test_pool_options():
+    store = create_redis_store(StandaloneConfig)
+    pool = store.connection_pool
+    assert isinstance(store, StrictRedis)
+    assert isinstance(pool, BlockingConnectionPool)
+    assert pool.max_connections == 7
+    assert pool.timeout == 2
+    kwargs = pool.connection_kwargs
+    assert (kwargs['host'], kwargs['port'], kwargs['db']) == ('10.0.0.1', 6380, 3)
+    assert kwargs['socket_timeout'] == 4
+    assert kwargs['socket_connect_timeout'] == 1
+    assert kwargs['health_check_interval'] == 15
+    assert kwargs['decode_responses'] is True
+    assert create_redis_store(StandaloneConfig, decode_responses=False).connection_pool.connection_kwargs[
+        'decode_responses'] is False
+
+
+def test_pool_options_not_modified(rediscluster):
+    create_redis_store(ClusterConfig)
+    create_redis_store(StandaloneConfig)
+    assert StandaloneConfig.REDIS_POOL_OPTIONS == POOL_OPTIONS
+    assert 'db' in POOL_OPTIONS
+
+
+def test_cluster(rediscluster):
+    store = create_redis_store(ClusterConfig)
+    assert isinstance(store, rediscluster.RedisCluster)
+    kwargs = store.kwargs
+    assert kwargs['startup_nodes'] == ClusterConfig.REDIS_CLUSTER_NODES
+    assert kwargs['decode_responses'] is True
+    assert kwargs['skip_full_coverage_check'] is True
+    assert kwargs['max_connections'] == 7
+    assert kwargs['socket_timeout'] == 4
+    # 集群只有 db 0，节点来自 startup_nodes
+    for name in ('db', 'host', 'port', 'timeout'):
+        assert name not in kwargs
+
+
+def test_cluster_default_node(rediscluster, monkeypatch):
+    monkeypatch.setattr(ClusterConfig, 'REDIS_CLUSTER_NODES', None)
+    store = create_redis_store(ClusterConfig)
+    assert store.kwargs['startup_nodes'] == [{'host': '10.0.0.1', 'port': 6380}]
+
+
+def test_cluster_without_rediscluster(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'rediscluster', None)
+    with pytest.raises(RuntimeError) as info:
+        create_redis_store(ClusterConfig)
+    assert 'redis-py-cluster' in str(info.value)
+
+
+def test_pipeline_without_transaction(client):
+    with pipeline(client) as pipe:
+        assert not pipe.transaction
+        pipe.set('a', 1)
+        pipe.rpush('b', 1, 2)
+        assert client.get('a') is None
+    assert client.get('a') == '1'
+    assert client.lrange('b', 0, -1) == ['1', '2']
+
+
+def test_pipeline_discards_on_error(client):
+    with pytest.raises(RuntimeError):
+        with pipeline(client) as pipe:
+            pipe.set('a', 1)
+            raise RuntimeError()
+    assert client.get('a') is None
+
+
+def test_set_many(client):
+    set_many(client, {'car_1': 'on', 'car_2': 'off'})
+    assert client.mget('car_1', 'car_2') == ['on', 'off']
+    assert client.ttl('car_1') == -1
+
+    set_many(client, {'car_3': 1}, ex=30)
+    assert 0 < client.ttl('car_3') <= 30
+
+    set_many(client, {})
+
+
+def test_hset_many(client):
+    client.hset('car_1', 'other', 'x')
+    hset_many(client, {'car_1': {'status': 1, 'speed': 2}, 'car_2': {'status': 0}})
+    assert client.hgetall('car_1') == {'other': 'x', 'status': '1', 'speed': '2'}
+    assert client.hgetall('car_2') == {'status': '0'}
+
+
+def test_pop_many(client):
+    client.lpush('queue', *range(5))
+    assert pop_many(client, 'queue', 3) == ['0', '1', '2']
+    assert pop_many(client, 'queue', 10) == ['3', '4']
+    assert pop_many(client, 'queue', 10) == []
+    assert not client.exists('queue')
+    client.lpush('queue', 1)
+    assert pop_many(client, 'queue', 0) == []
+    assert client.llen('queue') == 1
+
+
+def test_pop_many_with_concurrent_push():
+    '''取出过程中不断有其他客户端 LPUSH，所有消息都按入队顺序取出一次'''
+    server = fakeredis.FakeServer()
+    producer = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    consumer = fakeredis.FakeStrictRedis(server=server, decode_responses=True)
+    total = 3000
+    done = threading.Event()
+
+    def produce():
+        for i in range(total):
+            producer.lpush('queue', i)
+        done.set()
+
+    thread = threading.Thread(target=produce)
+    thread.start()
+    received = []
+    while not done.is_set() or consumer.llen('queue'):
+        received.extend(pop_many(consumer, 'queue', 7))
+    thread.join()
+    assert received == [str(i) for i in range(total)]
@@ -0,0 +1,125 @@
+import datetime
+import os
+import time
+
+import fakeredis
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from demo_text import db
+from demo_text.models.models import Car, CarEveryday, Taskdetail
+from demo_text.utils import rollup
+from demo_text.utils.rollup import day_timestamp, rollup_car_everyday
+
+from conftest import HEADERS, make_taskdetail
+
+# 汇总 sql 使用 MySQL 语法，设置该环境变量（指向可以建表、删表的测试库）时才执行
+MYSQL_URI = os.environ.get('ROLLUP_TEST_DATABASE_URI')
+
+
+def set_tz(name):
+    if name is None:
+        os.environ.pop('TZ', None)
+    else:
+        os.environ['TZ'] = name
+    time.tzset()
+
+
+@pytest.fixture(params=['Asia/Shanghai', 'America/New_York', 'UTC'])
+def local_tz(request):
+    previous = os.environ.get('TZ')
+    set_tz(request.param)
+    yield request.param
+    set_tz(previous)
+
+
+def test_day_timestamp_is_local_midnight(local_tz):
+    for day in (datetime.date(2024, 1, 1), datetime.date(2024, 3, 10), datetime.date(2024, 11, 3)):
+        stamp = day_timestamp(day)
+        assert datetime.datetime.fromtimestamp(stamp) == datetime.datetime(day.year, day.month, day.day)
+        # 同一天内的任意时刻落在同一个桶
+        assert day_timestamp(datetime.datetime(day.year, day.month, day.day, 23, 59, 59)) == stamp
+        next_day = day + datetime.timedelta(days=1)
+        assert day_timestamp(next_day) > stamp
+
+
+@pytest.mark.parametrize('local_tz', ['America/New_York'], indirect=True)
+def test_day_timestamp_across_dst(local_tz):
+    '''夏令时切换当天为 23 或 25 小时，按日期计算的桶仍然首尾相接'''
+    assert day_timestamp(datetime.date(2024, 3, 11)) - day_timestamp(datetime.date(2024, 3, 10)) == 23 * 3600
+    assert day_timestamp(datetime.date(2024, 11, 4)) - day_timestamp(datetime.date(2024, 11, 3)) == 25 * 3600
+
+
+def test_history_filter_uses_same_buckets(client, local_tz):
+    days = [datetime.date(2024, 1, d) for d in (1, 2, 3)]
+    db.session.add_all(CarEveryday(car_id=1, data=day, datatime=day_timestamp(day), atime=i, mileage=0)
+                       for i, day in enumerate(days))
+    db.session.commit()
+
+    data = client.get('/api/history/careveryday/', headers=HEADERS,
+                      query_string={'begin': '2024-01-02', 'end': '2024-01-02'}).get_json()['data']
+    assert [row['atime'] for row in data] == [1]
+    data = client.get('/api/history/careveryday/', headers=HEADERS,
+                      query_string={'begin': '2024-01-02'}).get_json()['data']
+    assert [row['atime'] for row in data] == [1, 2]
+
+
+@pytest.fixture
+def mysql_session(monkeypatch):
+    if not MYSQL_URI:
+        pytest.skip('ROLLUP_TEST_DATABASE_URI is not set')
+    monkeypatch.setattr(rollup, 'redis_store', fakeredis.FakeStrictRedis(decode_responses=True))
+    # 模型中 taskdetail.endtime 的默认值为 ''，关闭严格模式才能按模型建表
+    engine = create_engine(MYSQL_URI, connect_args={'init_command': "SET sql_mode = 'NO_ENGINE_SUBSTITUTION'"})
+    tables = [model.__table__ for model in (Car, Taskdetail, CarEveryday)]
+    db.Model.metadata.drop_all(engine, tables=tables)
+    db.Model.metadata.create_all(engine, tables=tables)
+    session = sessionmaker(bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        db.Model.metadata.drop_all(engine, tables=tables)
+        engine.dispose()
+
+
+def snapshot(session):
+    everyday = [(row.car_id, row.datatime, row.atime, row.mileage)
+                for row in session.query(CarEveryday).order_by(CarEveryday.car_id, CarEveryday.datatime)]
+    cars = [(row.id, row.caratime, row.carmileage) for row in session.query(Car).order_by(Car.id)]
+    session.rollback()
+    return everyday, cars
+
+
+def test_rollup_is_idempotent(mysql_session):
+    session = mysql_session
+    session.add(Car(id=1, carnum='A1', deviceid=1, devicekey='k', devicesecret='s', productkey='p',
+                    carmileage=1234))
+    day = datetime.datetime(2024, 1, 1)
+    session.add_all([
+        make_taskdetail(carid=1, begintime=day + datetime.timedelta(hours=8),
+                        endtime=day + datetime.timedelta(hours=9)),
+        # 跨零点的任务按开始日期计入前一天
+        make_taskdetail(carid=1, begintime=day + datetime.timedelta(hours=23, minutes=30),
+                        endtime=day + datetime.timedelta(days=1, minutes=30)),
+        make_taskdetail(carid=1, begintime=day + datetime.timedelta(days=1, hours=10),
+                        endtime=day + datetime.timedelta(days=1, hours=10, minutes=20)),
+        # 未完成的任务不计入
+        make_taskdetail(carid=1, taskstu=3, begintime=day + datetime.timedelta(hours=12),
+                        endtime=day + datetime.timedelta(hours=13)),
+    ])
+    session.commit()
+
+    until = day + datetime.timedelta(days=3)
+    rollup_car_everyday(until=until, session=session)
+    first = snapshot(session)
+    assert first == ([(1, day_timestamp(day), 7200, 0), (1, day_timestamp(day + datetime.timedelta(days=1)), 1200, 0)],
+                     [(1, 8400, 1234)])
+
+    # 从水位重跑、完全从头重跑，结果都不变
+    rollup_car_everyday(until=until, overlap=3 * 86400, session=session)
+    assert snapshot(session) == first
+    rollup.redis_store.delete(rollup.ROLLUP_WATERMARK_KEY)
+    rollup_car_everyday(until=until, session=session)
+    assert snapshot(session) == first